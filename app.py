@@ -1,5 +1,7 @@
 import os
 import re
+import shutil
+import sys
 import time
 import traceback
 import uuid
@@ -13,10 +15,21 @@ from langchain_core.documents import Document
 
 load_dotenv()
 CHROMA_PATH = "chroma_db"
+EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+# Textbook context sent to Gemini per question, in (estimated) tokens
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 6000))
+CHARS_PER_TOKEN = 4  # Gemini's rule of thumb; counted locally so no API call is spent on it
+# Fuse BM25 keyword search with vector search; HYBRID_SEARCH=0 falls back to vector search only
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "1") != "0"
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 20))  # taken from each ranking before fusing
+# Serve stored answers to near-duplicate questions instead of calling Gemini; ANSWER_CACHE=0 turns it off
+ANSWER_CACHE = os.environ.get("ANSWER_CACHE", "1") != "0"
 
 from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
 
 SELECTION_FILE = os.path.join("books", "selection.txt")
+NOT_INDEXED_MESSAGE = ("📭 **{book}** isn't indexed yet. Wait for its ingestion to finish, "
+                       "or upload it again from the Library.")
 
 def save_selection(book_name):
     if not os.path.exists("books"):
@@ -41,16 +54,68 @@ def get_all_api_keys():
             keys.append(v.strip())
     return list(dict.fromkeys(keys))
 
+@st.cache_resource(show_spinner="Moving books into per-book collections...")
+def migrate_legacy_collection():
+    """One-time move of the old shared "langchain" collection into per-book collections."""
+    from scripts import book_collections
+    if book_collections.legacy_collection() is not None:
+        book_collections.migrate()
+    return True
+
 @st.cache_resource(show_spinner="Loading Database...")
-def load_db():
-    """Loads the ChromaDB vector store."""
+def load_book_db(book):
+    """
+    Loads the vector store of one book (its own collection). With RETRIEVAL_BACKEND=numpy
+    the book is searched in-process by exact NumPy search instead of through Chroma;
+    "int8" and "pq" search compressed vectors and re-rank the best candidates exactly.
+    Raises chromadb.errors.NotFoundError (never cached) if the book isn't indexed yet.
+    """
+    import chromadb.errors
+    if "scripts" not in sys.path:
+        sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+    from scripts.book_collections import collection_name, get_client, get_collection
+    from scripts.numpy_store import RETRIEVAL_BACKEND, NumpyVectorStore, QuantizedVectorStore
     try:
-        embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-        return Chroma(persist_directory=CHROMA_PATH, embedding_function=embeddings, collection_name="langchain")
+        migrate_legacy_collection()
+        # Opening a missing collection through Chroma would create an empty one
+        get_collection(book, create=False)
+        embeddings = FastEmbedEmbeddings(model_name=EMBED_MODEL)
+        if RETRIEVAL_BACKEND == "numpy":
+            return NumpyVectorStore(book, embeddings)
+        if RETRIEVAL_BACKEND in ("int8", "pq"):
+            return QuantizedVectorStore(book, embeddings, mode=RETRIEVAL_BACKEND)
+        return Chroma(client=get_client(), embedding_function=embeddings, collection_name=collection_name(book),
+                      create_collection_if_not_exists=False)
+    except chromadb.errors.NotFoundError:
+        raise
     except Exception as e:
         print(f"Failed to load ChromaDB: {e}")
         return None
 
+@st.cache_resource
+def get_retrieval_cache():
+    """In-memory LRU cache of retrieved chunks per (book, chapter scope, normalized question), shared by all sessions."""
+    if "scripts" not in sys.path:
+        sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+    from scripts.query_cache import LRUCache
+    return LRUCache()
+
+def load_db(book=None):
+    """
+    Returns the vector store of a book (defaults to the selected book), or None if no book is selected
+    or it failed to load. Raises chromadb.errors.NotFoundError if the book isn't indexed yet.
+    Stores are re-opened whenever the ingestion worker has written to any book since they were loaded.
+    """
+    book = book or st.session_state.get("selected_book")
+    if not book:
+        return None
+    if "scripts" not in sys.path:
+        sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+    from scripts.book_collections import refresh_client
+    if refresh_client():
+        load_book_db.clear()
+    return load_book_db(book)
+
 def delete_book_data(book_filename):
     """Removes a book's PDF, vector embeddings, and question history."""
     try:
@@ -61,23 +126,41 @@ def delete_book_data(book_filename):
         pass
 
     try:
-        db = load_db()
-        if db:
-            db.delete(where={"source": book_filename})
+        if "scripts" not in sys.path:
+            sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+        from scripts.book_collections import drop_book
+        from scripts.lexical_index import remove
+        from scripts.numpy_store import remove_export
+        drop_book(book_filename)
+        remove(book_filename)
+        remove_export(book_filename)
+        load_book_db.clear()  # cached stores would point at the dropped collection
+        get_retrieval_cache().invalidate(book_filename)
     except:
-        try:
-            import chromadb
-            client = chromadb.PersistentClient(path="chroma_db")
-            coll = client.get_collection("langchain")
-            coll.delete(where={"source": book_filename})
-        except:
-            pass
+        pass
+
+    try:
+        from scripts.answer_cache import invalidate
+        invalidate(book_filename)
+    except:
+        pass
 
     try:
         db_utils.delete_past_questions_by_source(book_filename)
     except:
         pass
 
+    try:
+        db_utils.delete_jobs_by_source(book_filename)
+    except:
+        pass
+
+    try:
+        from scripts.ingest_state import clear_state
+        clear_state(book_filename)
+    except:
+        pass
+
 @st.cache_resource
 def load_llms(api_key=None):
     """Initializes the Gemini LLM chain with model fallbacks."""
@@ -498,16 +581,12 @@ def apply_global_styles():
     )
 
 def get_chapters(db):
-    """Returns the list of chapter names stored in the vector DB for the active book."""
+    """Returns the list of chapter names stored in the active book's collection."""
     import chromadb.errors
     if db is None:
         return ["All Chapters"]
     try:
-        where_filter = None
-        if "selected_book" in st.session_state and st.session_state.selected_book:
-            where_filter = {"source": st.session_state.selected_book}
-            
-        sample_data = db.get(limit=1000, include=["metadatas"], where=where_filter)
+        sample_data = db.get(limit=1000, include=["metadatas"])
         raw_chapters = list(set(meta["chapter"] for meta in sample_data["metadatas"] if meta and "chapter" in meta))
         
         def chapter_sort_key(ch):
@@ -586,15 +665,79 @@ def is_off_topic(prompt: str) -> bool:
             return True
     return False
 
-def retrieve_documents(prompt, selected_chapter, chapters, db):
-    """Retrieves relevant document chunks from ChromaDB using chapter filtering or semantic search."""
-    import chromadb.errors
+def lexical_ranking(book, prompt, k, where=None):
+    """
+    Chunk IDs of the book's best BM25 matches for the prompt, best first. Books ingested
+    before the keyword index existed get it built from their collection on first use.
+    Returns [] if keyword search fails, so retrieval falls back to vector search.
+    """
+    if "scripts" not in sys.path:
+        sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+    from scripts import lexical_index
+    try:
+        if not lexical_index.exists(book):
+            with st.spinner("Building keyword index..."):
+                print(f"Indexed {lexical_index.rebuild(book)} chunks of '{book}' for keyword search.")
+        return [chunk_id for chunk_id, _ in lexical_index.search(book, prompt, k, where)]
+    except Exception as e:
+        print(f"Keyword search failed, using vector search only: {e}")
+        return []
+
+def hybrid_search(db, book, prompt, query_vector, k=5, where=None):
+    """
+    Returns the top-k chunks by reciprocal rank fusion of vector search and BM25 keyword
+    search, so exact Dutch and Latin terms the English embedding model misses still
+    surface. With HYBRID_SEARCH=0 this is plain vector search.
+    """
+    if not HYBRID_SEARCH:
+        return db.similarity_search_by_vector(query_vector, k=k, filter=where)
+    from scripts.lexical_index import reciprocal_rank_fusion
+    candidates = max(k, HYBRID_CANDIDATES)
+    vector_docs = db.similarity_search_by_vector(query_vector, k=candidates, filter=where)
+    fused = reciprocal_rank_fusion([[doc.id for doc in vector_docs],
+                                    lexical_ranking(book, prompt, candidates, where)])[:k]
+    found = {doc.id: doc for doc in vector_docs}
+    missing = [chunk_id for chunk_id in fused if chunk_id not in found]
+    if missing:  # keyword-only hits
+        extra = db.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, d, m in zip(extra["ids"], extra.get("documents") or [], extra.get("metadatas") or []):
+            if d:
+                found[chunk_id] = Document(page_content=d, metadata=m, id=chunk_id)
+    return [found[chunk_id] for chunk_id in fused if chunk_id in found]
+
+def retrieve_documents(prompt, selected_chapter, chapters, db, book=None):
+    """
+    Retrieves relevant document chunks of a book (defaults to the selected book) using
+    chapter filtering or hybrid search. Repeated questions are served from the retrieval
+    cache until the book is re-ingested, re-tagged or deleted.
+    """
     if db is None:
         return [], []
+    book = book or st.session_state.get("selected_book")
+    cache = get_retrieval_cache()
+    from scripts.ingest_state import state_mtime
+    from scripts.query_cache import normalize_query
+    key = (book, selected_chapter or "All Chapters", normalize_query(prompt))
+    version = state_mtime(book)
+    cached = cache.get(key, version)
+    if cached is not None:
+        stats = cache.stats()
+        print(f"Retrieval cache hit ({stats['hits']} hits / {stats['misses']} misses, {stats['hit_rate']:.0%}).")
+        docs, target_chapters = cached
+        return list(docs), list(target_chapters)
+    docs, target_chapters = _retrieve_documents(prompt, selected_chapter, chapters, db, book)
+    if docs:  # an empty result may be a transient error, so don't keep it
+        cache.put(key, (docs, target_chapters), version)
+    return docs, target_chapters
+
+def _retrieve_documents(prompt, selected_chapter, chapters, db, book):
+    """retrieve_documents without the cache."""
+    import chromadb.errors
+    from scripts.query_cache import embed_query
     try:
+        query_vector = embed_query(db.embeddings, EMBED_MODEL, prompt)
+        # db is the selected book's own collection, so no source filter is needed
         raw_filter = {}
-        if "selected_book" in st.session_state and st.session_state.selected_book:
-            raw_filter["source"] = st.session_state.selected_book
 
         target_chapters = []
         if selected_chapter and selected_chapter != "All Chapters":
@@ -621,46 +764,36 @@ def retrieve_documents(prompt, selected_chapter, chapters, db):
                     target_chapters.append(inferred)
 
         if target_chapters:
-            # Fetch entire chapter using the ChromaDB client directly for reliability
             if len(target_chapters) == 1:
                 raw_filter["chapter"] = target_chapters[0]
             else:
                 raw_filter["chapter"] = {"$in": target_chapters}
             where_clause = _build_chroma_where(raw_filter)
-            try:
-                # Access underlying ChromaDB collection for precise filtered fetch
-                coll = db._collection
-                chapter_data = coll.get(
-                    where=where_clause if where_clause else None,
-                    include=["documents", "metadatas"]
-                )
-                documents = chapter_data.get("documents") or []
-                metadatas = chapter_data.get("metadatas") or []
-                docs = [
-                    Document(page_content=d, metadata=m)
-                    for d, m in zip(documents, metadatas)
-                    if d
-                ]
-            except Exception:
-                # Fallback: try LangChain wrapper get()
-                lc_where = where_clause if where_clause else None
-                chapter_data = db.get(where=lc_where, include=["documents", "metadatas"])
-                documents = chapter_data.get("documents") or []
-                metadatas = chapter_data.get("metadatas") or []
-                docs = [
-                    Document(page_content=d, metadata=m)
-                    for d, m in zip(documents, metadatas)
-                    if d
-                ]
-            docs.sort(key=lambda x: x.metadata.get("page", 0))
-            return docs, target_chapters
+            # Chroma and the NumPy backend share Chroma's get() signature
+            chapter_data = db.get(where=where_clause if where_clause else None, include=["documents", "metadatas"])
+            documents = chapter_data.get("documents") or []
+            metadatas = chapter_data.get("metadatas") or []
+            in_scope = {
+                chunk_id: Document(page_content=d, metadata=m, id=chunk_id)
+                for chunk_id, d, m in zip(chapter_data["ids"], documents, metadatas)
+                if d
+            }
+            if not in_scope:
+                return [], target_chapters
+            # Rank the whole chapter scope by similarity to the question, then keep what fits the budget
+            order = [doc.id for doc in db.similarity_search_by_vector(query_vector, k=len(in_scope),
+                                                                      filter=where_clause or None)]
+            if HYBRID_SEARCH:
+                from scripts.lexical_index import reciprocal_rank_fusion
+                order = reciprocal_rank_fusion([order, lexical_ranking(book, prompt, HYBRID_CANDIDATES,
+                                                                       where_clause or None)])
+            ranked = [in_scope.pop(chunk_id) for chunk_id in order if chunk_id in in_scope]
+            ranked += sorted(in_scope.values(), key=lambda x: x.metadata.get("page", 0))  # any the search missed
+            return pack_context(ranked), target_chapters
         else:
-            # Focused semantic search
-            search_kwargs = {"k": 5}
-            if raw_filter:
-                search_kwargs["filter"] = _build_chroma_where(raw_filter)
-            retriever = db.as_retriever(search_type="similarity", search_kwargs=search_kwargs)
-            return retriever.invoke(prompt), []
+            # Focused hybrid search
+            where_clause = _build_chroma_where(raw_filter) if raw_filter else None
+            return pack_context(hybrid_search(db, book, prompt, query_vector, k=5, where=where_clause)), []
     except chromadb.errors.NotFoundError:
         return [], []
     except Exception as e:
@@ -669,9 +802,34 @@ def retrieve_documents(prompt, selected_chapter, chapters, db):
         traceback.print_exc()
         return [], []
 
+def estimate_tokens(text):
+    """Approximate Gemini token count of a text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def format_context_chunk(doc):
+    """One chunk as it appears in the prompt's TEXT EXCERPT."""
+    return f"--- Chapter: {doc.metadata.get('chapter', 'Unknown')} | Page: {doc.metadata.get('page', 'Unknown')} ---\n{doc.page_content}"
+
+def pack_context(ranked_docs, budget=None):
+    """
+    Keeps the best-ranked chunks until the context token budget is spent (always at least
+    one) and returns them in reading order, so a wide chapter range can't flood the prompt.
+    """
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    packed, used = [], 0
+    for doc in ranked_docs:
+        tokens = estimate_tokens(format_context_chunk(doc)) + 1  # + the blank line between chunks
+        if packed and used + tokens > budget:
+            continue  # a shorter, lower-ranked chunk may still fit
+        packed.append(doc)
+        used += tokens
+    if len(packed) < len(ranked_docs):
+        print(f"Context budget: kept {len(packed)} of {len(ranked_docs)} chunks (~{used} of {budget} tokens).")
+    return sorted(packed, key=lambda x: (x.metadata.get("page", 0), x.metadata.get("start_index", 0)))
+
 def build_prompt(prompt, docs, summary_level, response_style, selected_chapter=None, inferred_chapters=None):
     """Builds the final prompt string from retrieved document chunks and user settings."""
-    context_text = "\n\n".join([f"--- Chapter: {doc.metadata.get('chapter', 'Unknown')} | Page: {doc.metadata.get('page', 'Unknown')} ---\n{doc.page_content}" for doc in docs])
+    context_text = "\n\n".join(format_context_chunk(doc) for doc in docs)
     
     if summary_level == "Low":
         detail_instruction = (
@@ -817,6 +975,44 @@ def execute_llm_stream(llm_chain, final_prompt, message_placeholder, docs):
         message_placeholder.markdown(response)
         return response
 
+def answer_cache_key(book, selected_chapter, inferred_chapters, summary_level, response_style):
+    """(book, chapter scope, depth, style) an answer is cached under; the scope includes chapters named in the question."""
+    if selected_chapter and selected_chapter != "All Chapters":
+        scope = selected_chapter
+    else:
+        scope = ", ".join(inferred_chapters) or "All Chapters"
+    return book, scope, summary_level, response_style
+
+def cached_answer(db, prompt, key):
+    """Returns the stored answer to a near-duplicate question (see scripts/answer_cache.py), or None."""
+    if not ANSWER_CACHE:
+        return None
+    from scripts import answer_cache
+    from scripts.ingest_state import state_mtime
+    from scripts.query_cache import embed_query
+    try:
+        hit = answer_cache.lookup(*key, embed_query(db.embeddings, EMBED_MODEL, prompt), version=state_mtime(key[0]))
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None
+    if hit:
+        print(f"Answer cache hit ({hit['similarity']:.3f} similar to: {hit['question']!r}).")
+        return hit["answer"]
+    return None
+
+def save_answer(db, prompt, key, response):
+    """Stores a fresh LLM answer in the answer cache (error messages are not stored)."""
+    if not ANSWER_CACHE or response.startswith("⚠️"):
+        return
+    from scripts import answer_cache
+    from scripts.ingest_state import state_mtime
+    from scripts.query_cache import embed_query
+    try:
+        answer_cache.store(*key, embed_query(db.embeddings, EMBED_MODEL, prompt), prompt, response,
+                           version=state_mtime(key[0]))
+    except Exception as e:
+        print(f"Answer cache store failed: {e}")
+
 def auto_scroll():
     """Injects JavaScript to scroll to the latest chat message."""
     js = """
@@ -834,6 +1030,72 @@ def auto_scroll():
     """
     st.components.v1.html(js, height=0)
 
+def load_chapter_draft(book):
+    """
+    Returns (total_pages, chapter_draft) for an embedded book, from its manifest or,
+    for books ingested before manifests existed, from the chapters stored in Chroma.
+    """
+    import fitz
+    from scripts.ingest_state import load_state, chapter_map_from_state
+
+    with fitz.open(os.path.join("books", book)) as doc:
+        total_pages = len(doc)
+
+    state = load_state(book)
+    if state and state.get("chapter_map"):
+        chapter_map = chapter_map_from_state(state)
+    else:
+        # Each chapter starts at the lowest page any of its chunks came from
+        import chromadb.errors
+        first_page = {}
+        try:
+            db = load_db(book)
+        except chromadb.errors.NotFoundError:
+            db = None
+        metas = db.get(include=["metadatas"])["metadatas"] if db else []
+        for meta in metas:
+            if meta.get("chapter") and meta.get("page") is not None:
+                first_page[meta["chapter"]] = min(int(meta["page"]), first_page.get(meta["chapter"], 10 ** 9))
+        chapter_map = {page: chapter for chapter, page in first_page.items()} or {1: "Full Book"}
+
+    starts = sorted(chapter_map)
+    draft = [{"id": str(uuid.uuid4())[:8], "name": chapter_map[start], "start_page": start,
+              "end_page": starts[i + 1] - 1 if i + 1 < len(starts) else total_pages}
+             for i, start in enumerate(starts)]
+    return total_pages, draft
+
+@st.fragment(run_every=1.0)
+def render_job_progress(job_id):
+    """Polls an ingestion job once per second and shows its progress; reruns the app when it ends."""
+    job = db_utils.get_job(job_id)
+    if job is None:
+        st.session_state.upload_state = "idle"
+        st.session_state.pop("upload_job_id", None)
+        st.rerun()
+
+    if job["status"] in db_utils.ACTIVE_JOB_STATUSES:
+        st.progress(min(job["progress"] or 0.0, 1.0))
+        st.caption(job["message"] or "")
+        return
+
+    if job["status"] == "done":
+        st.balloons()
+        from scripts.book_collections import refresh_client
+        refresh_client()  # the worker wrote the book from another process
+        st.cache_resource.clear()
+        for k in ["upload_state", "upload_filename", "upload_book_path", "upload_total_pages", "chapter_draft", "upload_job_id"]:
+            st.session_state.pop(k, None)
+        time.sleep(1.5)
+        st.rerun()
+
+    st.error(f"❌ Error: {job['error']}")
+    # The PDF and checkpoint are kept so the book can be resumed from the library
+    st.caption("Progress has been saved — use ▶️ Resume in the library to continue.")
+    if st.button("OK", use_container_width=True, key=f"job_ok_{job_id}"):
+        st.session_state.upload_state = "idle"
+        st.session_state.pop("upload_job_id", None)
+        st.rerun()
+
 def render_sidebar_library():
     """Renders the book library and PDF uploader inside the sidebar."""
     with st.sidebar:
@@ -1061,55 +1323,58 @@ def render_sidebar_library():
 
                 st.markdown("")
                 col_x, col_ok = st.columns(2)
+                editing_existing = st.session_state.get("upload_edit_existing", False)
+                review_keys = ["upload_state", "upload_filename", "chapter_draft", "upload_total_pages",
+                               "upload_book_path", "upload_edit_existing"]
                 with col_x:
                     if st.button("✗ Cancel", use_container_width=True):
                         # Cleanup the PDF we saved at scan time since user is cancelling
-                        delete_book_data(fname)
-                        for k in ["upload_state", "upload_filename", "upload_file_bytes", "chapter_draft", "upload_total_pages", "upload_book_path"]:
+                        # (an already embedded book that was only reopened is left alone)
+                        if not editing_existing:
+                            delete_book_data(fname)
+                        for k in review_keys:
                             st.session_state.pop(k, None)
                         st.rerun()
                 with col_ok:
-                    if st.button("✅ Embed", type="primary", use_container_width=True):
+                    if editing_existing:
+                        # Only the chapter tags change: rewrite them on the stored chunks in place
+                        if st.button("💾 Save", type="primary", use_container_width=True):
+                            import sys
+                            if "scripts" not in sys.path:
+                                sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
+                            from scripts.build_vector_db import update_chapter_map
+                            with st.spinner("Updating chapters..."):
+                                update_chapter_map(fname, {ch["start_page"]: ch["name"] for ch in new_draft})
+                            get_retrieval_cache().invalidate(fname)
+                            from scripts.answer_cache import invalidate
+                            invalidate(fname)
+                            for k in review_keys:
+                                st.session_state.pop(k, None)
+                            st.rerun()
+                    elif st.button("✅ Embed", type="primary", use_container_width=True):
                         st.session_state.upload_state = "processing"
                         st.rerun()
 
             elif upload_state == "processing":
                 st.markdown('<p class="lib-label">🔄 Embedding</p>', unsafe_allow_html=True)
-                st.caption(f"Processing **{fname}**... please wait.")
-                draft = st.session_state.get("chapter_draft", [])
-                chapter_map = {ch["start_page"]: ch["name"] for ch in draft}
-
-                import sys, io as _io
+                st.caption(f"Processing **{fname}** in the background — you can keep using the app.")
+                import sys
                 if "scripts" not in sys.path:
                     sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
-                from scripts.build_vector_db import build_vector_db as build_db_func
+                from scripts.ingest_worker import ensure_worker
 
-                file_bytes = st.session_state.get("upload_file_bytes", b"")
-                if not os.path.exists("books"):
-                    os.makedirs("books")
-                with open(os.path.join("books", fname), "wb") as f:
-                    f.write(file_bytes)
-
-                bar = st.progress(0.0)
-                msg = st.empty()
-                def update_progress(pct, text):
-                    msg.caption(text)
-                    bar.progress(min(pct, 1.0))
-
-                try:
-                    st.cache_resource.clear()
-                    build_db_func(_io.BytesIO(file_bytes), progress_callback=update_progress,
-                                  source=fname, chapter_map=chapter_map)
-                    st.balloons()
-                    for k in ["upload_state", "upload_filename", "upload_file_bytes", "chapter_draft"]:
-                        st.session_state.pop(k, None)
-                    time.sleep(1.5)
-                    st.rerun()
-                except Exception as e:
-                    msg.error(f"❌ Error: {e}")
-                    # Cleanup remnants on failure (files, partial embeddings, etc.)
-                    delete_book_data(fname)
-                    st.session_state.upload_state = "idle"
+                if "upload_job_id" not in st.session_state:
+                    draft = st.session_state.get("chapter_draft", [])
+                    chapter_map = {ch["start_page"]: ch["name"] for ch in draft}
+
+                    # The PDF was saved to books/ at scan time (or earlier, for resumed books)
+                    st.session_state.upload_job_id = db_utils.enqueue_job(
+                        fname, os.path.join("books", fname), chapter_map
+                    )
+
+                # Ingestion runs in the worker process; this session only polls the job
+                ensure_worker()
+                render_job_progress(st.session_state.upload_job_id)
 
             return  # Don't render the library or upload area below
 
@@ -1119,6 +1384,9 @@ def render_sidebar_library():
 
         books = [f for f in os.listdir("books") if f.endswith(".pdf")]
         is_proc = st.session_state.get("is_processing", False)
+        from scripts.ingest_state import load_state, chapter_map_from_state
+        # Books being ingested by the background worker (possibly from another session)
+        active_jobs = {job["source"]: job for job in db_utils.get_jobs()}
 
         # ── NORMAL LIBRARY VIEW ────────────────────────────────────────────
         # Sidebar Title
@@ -1132,27 +1400,55 @@ def render_sidebar_library():
         if books:
             for book in books:
                 is_active = st.session_state.get("selected_book") == book
+                state = load_state(book)
                 
-                # Three-column layout for Selection, Open, Delete
-                c1, c2, c3 = st.columns([3, 0.6, 0.6])
+                # Four-column layout for Selection, Edit chapters, Open, Delete
+                c1, c_edit, c2, c3 = st.columns([3, 0.6, 0.6, 0.6])
                 
                 with c1:
+                    if book in active_jobs:
+                        job = active_jobs[book]
+                        label = "queued" if job["status"] == "queued" else f"{int((job['progress'] or 0) * 100)}%"
+                        st.button(f"⏳ {book} ({label})", key=f"job_{book}", use_container_width=True, disabled=True)
+                    elif state and state.get("status") != "complete":
+                        # Interrupted ingestion: continue from the last checkpoint
+                        done, total = state.get("last_page", 0), state.get("total_pages", "?")
+                        if st.button(f"▶️ Resume {book} ({done}/{total})", key=f"resume_{book}",
+                                     use_container_width=True, disabled=is_proc):
+                            chapter_map = chapter_map_from_state(state)
+                            st.session_state.upload_state = "processing"
+                            st.session_state.upload_filename = book
+                            st.session_state.chapter_draft = [
+                                {"name": name, "start_page": start} for start, name in chapter_map.items()
+                            ]
+                            st.rerun()
                     # Clicking the filename selects the book
-                    lbl = f"✅ {book}" if is_active else book
-                    if st.button(lbl, key=f"sel_{book}", use_container_width=True,
-                                 type="primary" if is_active else "secondary", disabled=is_proc):
+                    elif st.button(f"✅ {book}" if is_active else book, key=f"sel_{book}", use_container_width=True,
+                                   type="primary" if is_active else "secondary", disabled=is_proc):
                         new_sel = None if is_active else book
                         st.session_state.selected_book = new_sel
                         save_selection(new_sel or "")
                         st.rerun()
                 
+                with c_edit:
+                    # Reopen the chapter editor for an embedded book; saving only re-tags its chunks
+                    if st.button("✏️", key=f"edit_{book}", use_container_width=True,
+                                 disabled=is_proc or book in active_jobs or bool(state and state.get("status") != "complete")):
+                        st.session_state.upload_state = "review"
+                        st.session_state.upload_filename = book
+                        st.session_state.upload_book_path = os.path.abspath(os.path.join("books", book))
+                        st.session_state.upload_total_pages, st.session_state.chapter_draft = load_chapter_draft(book)
+                        st.session_state.upload_edit_existing = True
+                        st.rerun()
+
                 with c2:
                     if st.button("📂", key=f"open_{book}", use_container_width=True, disabled=is_proc):
                         book_path = os.path.abspath(os.path.join("books", book))
                         os.system(f"open '{book_path}'")
                 
                 with c3:
-                    if st.button("🗑️", key=f"del_{book}", use_container_width=True, disabled=is_proc):
+                    if st.button("🗑️", key=f"del_{book}", use_container_width=True,
+                                 disabled=is_proc or book in active_jobs):
                         delete_book_data(book)
                         if st.session_state.get("selected_book") == book:
                             st.session_state.selected_book = None
@@ -1204,16 +1500,24 @@ def render_sidebar_library():
                 if "scripts" not in sys.path:
                     sys.path.append(os.path.join(os.path.dirname(__file__), "scripts"))
                 from scripts.build_vector_db import detect_chapters
-                with st.spinner("Scanning... (~30–60 sec for image-based PDFs)"):
-                    detected, total_pages = detect_chapters(uploaded_file)
-
-                # Save to disk now so the Open button works during review
+                # Stream the upload to disk once; every later step opens the file by path
                 if not os.path.exists("books"):
                     os.makedirs("books")
-                file_bytes = uploaded_file.getvalue()
                 book_path = os.path.join("books", uploaded_file.name)
-                with open(book_path, "wb") as f:
-                    f.write(file_bytes)
+                uploaded_file.seek(0)
+                with open(book_path + ".part", "wb") as f:
+                    shutil.copyfileobj(uploaded_file, f, length=1024 * 1024)
+                os.replace(book_path + ".part", book_path)
+
+                # Image-based PDFs are OCR'd in full here; the Embed step reuses that text
+                scan_bar = st.empty()
+                scan_msg = st.empty()
+                def update_scan_progress(pct, text):
+                    scan_msg.caption(text)
+                    scan_bar.progress(min(pct, 1.0))
+
+                with st.spinner("Scanning..."):
+                    detected, total_pages = detect_chapters(book_path, progress_callback=update_scan_progress)
 
                 # Compute end_page for each chapter (next chapter start - 1, last = total pages)
                 import uuid
@@ -1226,7 +1530,6 @@ def render_sidebar_library():
 
                 st.session_state.upload_state = "review"
                 st.session_state.upload_filename = uploaded_file.name
-                st.session_state.upload_file_bytes = file_bytes
                 st.session_state.upload_book_path = os.path.abspath(book_path)
                 st.session_state.upload_total_pages = total_pages
                 st.session_state.chapter_draft = detected
@@ -1472,7 +1775,12 @@ def run_test_mode():
     if st.session_state.test_phase == "config":
         st.markdown("<h2 style='text-align: center; margin-bottom: 30px;'>🎯 Test Configuration</h2>", unsafe_allow_html=True)
         
-        db = load_db()
+        import chromadb.errors
+        try:
+            db = load_db()
+        except chromadb.errors.NotFoundError:
+            st.info(NOT_INDEXED_MESSAGE.format(book=st.session_state.get("selected_book")))
+            return
         all_chapters = get_chapters(db)
         chapter_opts = [ch for ch in all_chapters if ch != "All Chapters"]
         
@@ -1517,7 +1825,6 @@ def run_test_mode():
             status_text.markdown(f"#### {fun_msg}")
             progress_bar.progress(current_pct)
             debug_info.caption(f"⚙️ Developer Info: {debug_msg}")
-        db = load_db()
         llms = load_llms()
         
         import test_utils
@@ -1527,11 +1834,10 @@ def run_test_mode():
         chapter_docs = {}
         total_chunks = 0
         try:
+            db = load_db()
             if st.session_state.test_config["chapters"]:
                 for ch in st.session_state.test_config["chapters"]:
                     raw_filter = {"chapter": ch}
-                    if st.session_state.get("selected_book"):
-                        raw_filter["source"] = st.session_state.selected_book
                     where_clause = _build_chroma_where(raw_filter)
                     chapter_data = db.get(where=where_clause if where_clause else None, include=["metadatas", "documents"])
                     if chapter_data and chapter_data["documents"]:
@@ -1539,10 +1845,7 @@ def run_test_mode():
                         chapter_docs[ch] = docs
                         total_chunks += len(docs)
             else:
-                where_filter = None
-                if st.session_state.get("selected_book"):
-                    where_filter = {"source": st.session_state.selected_book}
-                all_data = db.get(include=["metadatas", "documents"], where=where_filter)
+                all_data = db.get(include=["metadatas", "documents"])
                 if all_data and all_data["documents"]:
                     # Group all by chapter
                     for i, doc_text in enumerate(all_data["documents"]):
@@ -1830,7 +2133,12 @@ def run_study_mode():
     st.markdown("<p style='color: #64748b; font-size: 1.1rem; margin-bottom: 2rem;'>Master your material with Ai-driven insights.</p>", unsafe_allow_html=True)
 
     # Initialize environment
-    db = load_db()
+    import chromadb.errors
+    try:
+        db = load_db()
+    except chromadb.errors.NotFoundError:
+        st.info(NOT_INDEXED_MESSAGE.format(book=st.session_state.get("selected_book")))
+        st.stop()
     if db is None:
         st.error("⚠️ **Failed to load the Vector Database.** Please restart the app or run `python scripts/build_vector_db.py` first.")
         st.stop()
@@ -1900,9 +2208,19 @@ def run_study_mode():
                 response = "I couldn't find any relevant information in the book for that question."
                 message_placeholder.markdown(response)
             else:
-                message_placeholder.markdown("🧠 **Reading contexts & thinking...**")
-                final_prompt = build_prompt(prompt, docs, summary_level, response_style, selected_chapter=selected_chapter, inferred_chapters=inferred_chapters)
-                response = execute_llm_stream(llm_chain, final_prompt, message_placeholder, docs)
+                answer_key = answer_cache_key(st.session_state.get("selected_book"), selected_chapter,
+                                              inferred_chapters, summary_level, response_style)
+                response = cached_answer(db, prompt, answer_key)
+                if response is not None:
+                    response += "\n\n*⚡ Cached answer to a near-identical question.*"
+                    message_placeholder.markdown(response)
+                else:
+                    message_placeholder.markdown("🧠 **Reading contexts & thinking...**")
+                    final_prompt = build_prompt(prompt, docs, summary_level, response_style, selected_chapter=selected_chapter, inferred_chapters=inferred_chapters)
+                    context_tokens = sum(estimate_tokens(format_context_chunk(d)) for d in docs)
+                    print(f"Prompt: ~{estimate_tokens(final_prompt)} tokens, {len(docs)} chunks (~{context_tokens} context tokens).")
+                    response = execute_llm_stream(llm_chain, final_prompt, message_placeholder, docs)
+                    save_answer(db, prompt, answer_key, response)
             
         st.session_state.messages.append({"role": "assistant", "content": response})
         db_utils.save_message(st.session_state.current_session_id, "assistant", response)
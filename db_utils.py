@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import json
 import uuid
 import datetime
 from langchain_core.prompts import PromptTemplate
@@ -43,6 +44,26 @@ def init_db():
             )
         """)
         
+        # Ingestion jobs, filled by the sidebar and drained by scripts/ingest_worker.py
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT,
+                pdf_path TEXT,
+                chapter_map TEXT,
+                status TEXT,
+                progress REAL DEFAULT 0,
+                message TEXT,
+                error TEXT,
+                worker_pid INTEGER,
+                created_at TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
         # Migration: Add source column if it doesn't exist (for existing databases)
         try:
             cursor.execute("ALTER TABLE past_questions ADD COLUMN source TEXT")
@@ -151,3 +172,126 @@ def delete_past_questions_by_source(source):
         conn.commit()
 
 
+JOB_COLUMNS = ["id", "source", "pdf_path", "chapter_map", "status", "progress", "message", "error",
+               "worker_pid", "created_at", "started_at", "finished_at", "updated_at"]
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+def _job_from_row(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job["chapter_map"] = {int(p): name for p, name in json.loads(job["chapter_map"] or "[]")}
+    return job
+
+def enqueue_job(source, pdf_path, chapter_map):
+    """Queues a book for ingestion. Returns the job ID (the existing one if the book is already queued or running)."""
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT id FROM jobs WHERE source = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+            (source,) + ACTIVE_JOB_STATUSES
+        )
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        job_id = str(uuid.uuid4())
+        # Stored as [start_page, name] pairs: JSON object keys would turn page numbers into strings
+        cursor.execute(
+            "INSERT INTO jobs (id, source, pdf_path, chapter_map, status, progress, message, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, 'queued', 0, 'Waiting for the ingestion worker...', ?, ?)",
+            (job_id, source, pdf_path, json.dumps([[int(p), n] for p, n in chapter_map.items()]), now, now)
+        )
+        conn.commit()
+    return job_id
+
+def claim_next_job(worker_pid):
+    """
+    Marks the oldest queued job as running and returns it, or None if nothing is queued.
+    A book that already has a running job is never claimed twice.
+    """
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND source NOT IN (SELECT source FROM jobs WHERE status = 'running')
+            ORDER BY created_at LIMIT 1
+        """)
+        row = cursor.fetchone()
+        if not row:
+            return None
+        # The status check makes the claim atomic if several workers race for the same job
+        cursor.execute(
+            "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ?, updated_at = ?, "
+            "message = 'Starting...' WHERE id = ? AND status = 'queued'",
+            (worker_pid, now, now, row[0])
+        )
+        conn.commit()
+        if cursor.rowcount != 1:
+            return None
+    return get_job(row[0])
+
+def update_job_progress(job_id, progress, message):
+    """Records a running job's progress (0-1) and status line; also serves as its heartbeat."""
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE jobs SET progress = ?, message = ?, updated_at = ? WHERE id = ?",
+            (progress, message, now, job_id)
+        )
+        conn.commit()
+
+def finish_job(job_id, error=None):
+    """Marks a job as done, or as failed with the given error message."""
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if error:
+            cursor.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                (error, now, now, job_id)
+            )
+        else:
+            cursor.execute(
+                "UPDATE jobs SET status = 'done', progress = 1, message = 'Done', finished_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, job_id)
+            )
+        conn.commit()
+
+def requeue_job(job_id):
+    """Puts a running job back in the queue (used when its worker died mid-run)."""
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE jobs SET status = 'queued', worker_pid = NULL, message = 'Requeued after a worker restart...', "
+            "updated_at = ? WHERE id = ? AND status = 'running'",
+            (now, job_id)
+        )
+        conn.commit()
+
+def get_job(job_id):
+    """Returns a job as a dict, or None if it doesn't exist."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        return _job_from_row(row) if row else None
+
+def get_jobs(statuses=ACTIVE_JOB_STATUSES, limit=50):
+    """Returns the most recent jobs with one of the given statuses, newest first."""
+    placeholders = ", ".join("?" for _ in statuses)
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at DESC LIMIT ?",
+            tuple(statuses) + (limit,)
+        )
+        return [_job_from_row(row) for row in cursor.fetchall()]
+
+def delete_jobs_by_source(source):
+    """Deletes the finished job history of a book (queued and running jobs are kept)."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM jobs WHERE source = ? AND status NOT IN (?, ?)", (source,) + ACTIVE_JOB_STATUSES)
+        conn.commit()
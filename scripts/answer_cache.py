@@ -0,0 +1,160 @@
+"""
+Persistent semantic cache of study-mode answers.
+
+The same questions reach Gemini many times a day across a class. Answers are stored
+with the embedding of their question and keyed by book, chapter scope, depth
+(summary_level) and style (response_style); a new question in the same key whose
+embedding is at least ANSWER_CACHE_THRESHOLD cosine-similar to a stored one gets
+that answer without an LLM call. Entries expire after ANSWER_CACHE_TTL_HOURS, the
+least recently used ones are evicted beyond ANSWER_CACHE_MAX_ENTRIES, and every
+entry records the book's version (its manifest's modification time), so answers
+written before the book was re-ingested, re-indexed or re-tagged are never served.
+
+Usage:
+    python scripts/answer_cache.py list
+    python scripts/answer_cache.py prune --source "Anatomie.pdf"
+    python scripts/answer_cache.py prune --all
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+CACHE_DB_PATH = os.path.join("cache", "answers.db")
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.95))  # cosine similarity of the questions
+ANSWER_CACHE_TTL_HOURS = float(os.environ.get("ANSWER_CACHE_TTL_HOURS", 24 * 7))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 5000))
+
+
+def get_connection():
+    os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, timeout=60)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS answers (
+            id INTEGER PRIMARY KEY,
+            source TEXT,
+            scope TEXT,
+            summary_level TEXT,
+            response_style TEXT,
+            version TEXT,
+            question TEXT,
+            vector BLOB,
+            answer TEXT,
+            created REAL,
+            last_used REAL,
+            hits INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS answers_key ON answers (source, scope, summary_level, response_style)")
+    return conn
+
+
+def _version(version):
+    return None if version is None else str(version)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def lookup(source, scope, summary_level, response_style, vector, version=None, threshold=None):
+    """
+    Returns the cached answer to the most similar earlier question in the same key as
+    {"answer", "question", "similarity"}, or None if none is similar enough. Expired
+    entries and entries of an older book version are deleted on the way.
+    """
+    threshold = ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+    key = (source, scope, summary_level, response_style)
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("DELETE FROM answers WHERE source = ? AND scope = ? AND summary_level = ? AND response_style = ? "
+                     "AND (created < ? OR version IS NOT ?)",
+                     (*key, now - ANSWER_CACHE_TTL_HOURS * 3600, _version(version)))
+        rows = conn.execute("SELECT id, question, vector, answer FROM answers WHERE source = ? AND scope = ? "
+                            "AND summary_level = ? AND response_style = ?", key).fetchall()
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        similarities = matrix @ _unit(vector)
+        best = int(np.argmax(similarities))
+        if similarities[best] < threshold:
+            return None
+        conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE id = ?", (now, rows[best][0]))
+        conn.commit()
+    return {"answer": rows[best][3], "question": rows[best][1], "similarity": float(similarities[best])}
+
+
+def store(source, scope, summary_level, response_style, vector, question, answer, version=None):
+    """Stores an answer, then evicts the least recently used entries beyond ANSWER_CACHE_MAX_ENTRIES."""
+    now = time.time()
+    with get_connection() as conn:
+        conn.execute("INSERT INTO answers (source, scope, summary_level, response_style, version, question, vector, "
+                     "answer, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (source, scope, summary_level, response_style, _version(version), question,
+                      _unit(vector).tobytes(), answer, now, now))
+        conn.commit()
+    enforce_limits()
+
+
+def enforce_limits(max_entries=ANSWER_CACHE_MAX_ENTRIES):
+    """Deletes expired entries, then the least recently used ones beyond max_entries. Returns the number deleted."""
+    with get_connection() as conn:
+        cursor = conn.execute("DELETE FROM answers WHERE created < ?", (time.time() - ANSWER_CACHE_TTL_HOURS * 3600,))
+        removed = cursor.rowcount
+        cursor = conn.execute("DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC "
+                              "LIMIT -1 OFFSET ?)", (max(max_entries, 0),))
+        removed += cursor.rowcount
+        conn.commit()
+    return removed
+
+
+def invalidate(source=None):
+    """Deletes the cached answers of a book, or all of them. Returns the number deleted."""
+    with get_connection() as conn:
+        if source:
+            cursor = conn.execute("DELETE FROM answers WHERE source = ?", (source,))
+        else:
+            cursor = conn.execute("DELETE FROM answers")
+        conn.commit()
+    return cursor.rowcount
+
+
+def list_books():
+    """Returns one summary dict per book with cached answers."""
+    with get_connection() as conn:
+        rows = conn.execute("SELECT source, COUNT(*), COALESCE(SUM(hits), 0), MAX(last_used) FROM answers "
+                            "GROUP BY source ORDER BY MAX(last_used) DESC").fetchall()
+    return [{"source": r[0], "answers": r[1], "hits": r[2], "last_used": r[3]} for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the study-mode answer cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List books with cached answers")
+    prune_p = sub.add_parser("prune", help="Delete cached answers")
+    group = prune_p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--source", help="Book filename, e.g. Anatomie.pdf")
+    group.add_argument("--all", action="store_true", help="Empty the whole cache")
+    group.add_argument("--expired", action="store_true", help="Only delete expired and over-limit answers")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        books = list_books()
+        if not books:
+            print("Answer cache is empty.")
+            return
+        for b in books:
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(b["last_used"]))
+            print(f"{b['answers']:>6} answers  {b['hits']:>6} hits  {used}  {b['source']}")
+    elif args.expired:
+        print(f"Removed {enforce_limits()} answer(s).")
+    else:
+        print(f"Removed {invalidate(args.source)} answer(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmarks per-page OCR.
+
+Compares the old path (RGB render at 2x → JPEG encode → PIL decode → Tesseract) with
+the production `_ocr_page` (grayscale render wrapped zero-copy, per-page zoom,
+blank-page skip), run once as a single full-zoom pass (SELECTIVE_OCR=0) and once
+selectively (low-zoom pass, re-OCR of weak blocks or of the whole page). Each
+column shows time per page and the mean Tesseract word confidence it reached.
+
+Usage:
+    python scripts/bench_ocr.py books/MyBook.pdf --pages 20
+"""
+import argparse
+import io
+import time
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+import build_vector_db
+from build_vector_db import OCR_LANG, _choose_zoom, _ocr_page
+
+
+def legacy_page(page):
+    """The pre-raster-stage path, kept here as the baseline."""
+    t0 = time.perf_counter()
+    pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), alpha=False)
+    img = Image.open(io.BytesIO(pix.tobytes("jpeg")))
+    img.load()
+    t1 = time.perf_counter()
+    pytesseract.image_to_string(img, lang=OCR_LANG)
+    return t1 - t0, time.perf_counter() - t0
+
+
+def current_page(page, selective):
+    """Times the production _ocr_page with selective OCR on or off. Returns (seconds, confidence, no text read)."""
+    build_vector_db.SELECTIVE_OCR = selective
+    t0 = time.perf_counter()
+    text, confidence = _ocr_page(page, zoom="auto")
+    return time.perf_counter() - t0, confidence, confidence is None and not text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-page OCR timing: legacy path vs full-zoom vs selective OCR.")
+    parser.add_argument("pdf")
+    parser.add_argument("--pages", type=int, default=20, help="Number of pages to time (from the start)")
+    parser.add_argument("--raster-only", action="store_true", help="Skip Tesseract and time rendering only")
+    args = parser.parse_args()
+
+    if args.raster_only:
+        empty = {key: [] for key in ("text", "conf", "block_num", "par_num", "line_num", "left", "top", "width", "height")}
+        pytesseract.image_to_string = lambda *a, **k: ""
+        pytesseract.image_to_data = lambda *a, **k: empty
+
+    doc = fitz.open(args.pdf)
+    n = min(args.pages, len(doc))
+    totals = {"old": 0.0, "full": 0.0, "selective": 0.0}
+    confs = {"full": [], "selective": []}
+    blanks = 0
+
+    def conf(value):
+        return f"{value:5.1f}" if value is not None else "    -"
+
+    print(f"{'page':>5} {'zoom':>5} {'old raster':>11} {'old total':>10} {'full pass':>17} {'selective':>17}")
+    for i in range(n):
+        page = doc[i]
+        old_raster, old_total = legacy_page(page)
+        full_total, full_conf, blank = current_page(page, selective=False)
+        selective_total, selective_conf, _ = current_page(page, selective=True)
+        blanks += blank
+        totals["old"] += old_total
+        totals["full"] += full_total
+        totals["selective"] += selective_total
+        for key, value in (("full", full_conf), ("selective", selective_conf)):
+            if value is not None:
+                confs[key].append(value)
+        print(f"{i + 1:>5} {_choose_zoom(page):>5.2f} {old_raster * 1000:>9.1f}ms {old_total * 1000:>8.1f}ms "
+              f"{full_total * 1000:>8.1f}ms ({conf(full_conf)}) {selective_total * 1000:>8.1f}ms "
+              f"({conf(selective_conf)}){'  (no text)' if blank else ''}")
+
+    def mean(values):
+        return sum(values) / len(values) if values else None
+
+    print(f"\nMean per page over {n} pages ({blanks} blank or without text):")
+    print(f"  legacy:    {totals['old'] / n * 1000:.1f}ms")
+    print(f"  full pass: {totals['full'] / n * 1000:.1f}ms, confidence {conf(mean(confs['full'])).strip()}")
+    print(f"  selective: {totals['selective'] / n * 1000:.1f}ms, confidence {conf(mean(confs['selective'])).strip()} "
+          f"({totals['full'] / max(totals['selective'], 1e-9):.2f}x vs full pass)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Benchmarks retrieval backends on one book.
+
+Compares Chroma's HNSW search on the book's collection with the in-process NumPy
+backends (numpy_store.py) for the same query vectors: exact float32 search, and int8
+and product-quantized search with float re-rank. Each runs without a filter, with a
+chapter filter and with a page-range filter. Queries are the opening words of
+randomly picked chunks, embedded once up front, so only search time is measured.
+Recall@k is each backend's overlap with the exact top-k.
+
+Memory is measured the same way for every backend: each one is loaded and queried in
+a fresh process. "resident" is how much that grew the process's RSS, "peak" how far
+above the starting RSS it went at any point (the VmHWM high-water mark, so temporaries of a query
+count too; the high-water mark is reset first, so imports don't). "disk"
+is everything on disk the backend needs: Chroma is always the store of record, so the
+NumPy backends count the chroma_db folder plus their export and codes.
+
+Finally, exact vector search is compared with hybrid search (vector + BM25 fused by
+reciprocal rank fusion, see lexical_index.py) on how often the chunk a query was
+taken from comes back in the top k.
+
+Usage:
+    python scripts/bench_retrieval.py --source "Anatomie.pdf" --queries 200 --k 5
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import book_collections
+import lexical_index
+from build_vector_db import load_embeddings
+from numpy_store import NumpyVectorStore, QuantizedVectorStore, _export_dir
+
+
+def timed(fn, queries):
+    """Runs fn on every query. Returns (results, per-query latencies in ms)."""
+    results, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q))
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return results, np.array(latencies)
+
+
+def folder_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _rss():
+    """Current resident set size of this process in bytes, including mapped file pages (Linux only)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _peak_rss():
+    """
+    Peak resident set size of this process in bytes since the last reset. Read from
+    VmHWM: ru_maxrss would also keep the pre-reset peak of threads that have exited.
+    """
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+
+
+def _resident_bytes(backend, source, vectors_path, k):
+    """Runs in a fresh process: loads one backend, runs every query, returns the (RSS, peak RSS) growth."""
+    vectors = np.load(vectors_path)
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")  # resets the peak RSS to the current RSS
+    baseline = _rss()
+    if backend == "chroma":
+        collection = book_collections.get_collection(source, create=False)
+        for q in vectors:
+            collection.query(query_embeddings=[q], n_results=k, include=[])
+    else:
+        store = NumpyVectorStore(source, None) if backend == "numpy" else QuantizedVectorStore(source, None, mode=backend)
+        for q in vectors:
+            store.search_by_vector(q, k)
+    return _rss() - baseline, _peak_rss() - baseline
+
+
+def resident_bytes(backends, source, vectors, k):
+    """
+    {backend: (RSS growth, peak RSS growth)}, each measured in its own process, or
+    (None, None) per backend where unsupported.
+    """
+    if not os.path.exists("/proc/self/clear_refs"):
+        return dict.fromkeys(backends, (None, None))
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors_path = os.path.join(tmp, "queries.npy")
+        np.save(vectors_path, vectors)
+        context = multiprocessing.get_context("spawn")
+        result = {}
+        for backend in backends:
+            with context.Pool(1) as pool:
+                result[backend] = pool.apply(_resident_bytes, (backend, source, vectors_path, k))
+        return result
+
+
+def disk_bytes(source):
+    """Bytes on disk each backend needs: Chroma's store, plus the export and codes of the NumPy backends."""
+    chroma = folder_bytes(book_collections.CHROMA_PATH)
+    folder = _export_dir(source)
+    export = sum(os.path.getsize(os.path.join(folder, f)) for f in ("vectors.npy", "records.json"))
+    return {"chroma": chroma, "numpy": chroma + export,
+            "int8": chroma + export + os.path.getsize(os.path.join(folder, "int8.npz")),
+            "pq": chroma + export + os.path.getsize(os.path.join(folder, "pq.npz"))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval latency, recall and memory per backend on one book.")
+    parser.add_argument("--source", required=True, help="Book filename, e.g. Anatomie.pdf")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    embeddings = load_embeddings()
+    collection = book_collections.get_collection(args.source, create=False)
+    exact_store = NumpyVectorStore(args.source, embeddings)
+    records = exact_store.get(include=["documents", "metadatas"])
+    if not records["ids"]:
+        print(f"'{args.source}' has no chunks.")
+        return
+    ids = records["ids"]
+    started = time.perf_counter()
+    quantized = {mode: QuantizedVectorStore(args.source, embeddings, mode=mode) for mode in ("int8", "pq")}
+    print(f"Built/loaded quantized indexes in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    picks = [rng.randrange(len(ids)) for _ in range(args.queries)]
+    texts = [" ".join(records["documents"][i].split()[:12]) for i in picks]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    metas = [records["metadatas"][i] for i in picks]
+    print(f"{len(ids)} chunks, {len(vectors)} queries, k={args.k}\n")
+
+    backends = {
+        "chroma": lambda q, where: collection.query(query_embeddings=[q], n_results=args.k, where=where,
+                                                    include=[])["ids"][0],
+        "numpy": lambda q, where: [ids[r] for r, _ in exact_store.search_by_vector(q, args.k, where)],
+        "int8": lambda q, where: [ids[r] for r, _ in quantized["int8"].search_by_vector(q, args.k, where)],
+        "pq": lambda q, where: [ids[r] for r, _ in quantized["pq"].search_by_vector(q, args.k, where)],
+    }
+    resident = resident_bytes(list(backends), args.source, vectors, args.k)
+    disk = disk_bytes(args.source)
+    filters = {
+        "none": lambda m: None,
+        "chapter": lambda m: {"chapter": {"$eq": m.get("chapter")}},
+        "pages": lambda m: {"$and": [{"page": {"$gte": m.get("page", 1) - 20}}, {"page": {"$lte": m.get("page", 1) + 20}}]},
+    }
+
+    print(f"{'filter':<8} {'backend':<7} {'mean':>8} {'p50':>8} {'p95':>8} {'recall@k':>9}")
+    for label, where_for in filters.items():
+        items = list(range(len(vectors)))
+        results, latencies = {}, {}
+        for name, search in backends.items():
+            results[name], latencies[name] = timed(lambda i: search(vectors[i], where_for(metas[i])), items)
+        for name, ms in latencies.items():
+            recall = np.mean([len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(results[name], results["numpy"])])
+            print(f"{label:<8} {name:<7} {ms.mean():>6.3f}ms {np.percentile(ms, 50):>6.3f}ms "
+                  f"{np.percentile(ms, 95):>6.3f}ms {recall:>9.3f}")
+
+    def mb(n):
+        return f"{n / 1024 / 1024:>8.2f}MB" if n is not None else f"{'n/a':>10}"
+
+    print(f"\n{'backend':<7} {'resident':>10} {'peak':>10} {'disk':>10}")
+    for name in backends:
+        print(f"{name:<7} {mb(resident[name][0])} {mb(resident[name][1])} {mb(disk[name])}")
+    print("resident / peak = RSS growth after / at most during loading the backend and running the unfiltered "
+          "queries, in a fresh process; disk = chroma_db plus the backend's export and codes")
+
+    if not lexical_index.exists(args.source):
+        lexical_index.rebuild(args.source)
+    candidates = max(args.k, 20)
+    lexical, lexical_ms = timed(lambda i: [c for c, _ in lexical_index.search(args.source, texts[i], candidates)],
+                                range(len(vectors)))
+    vector_hits, hybrid_hits = [], []
+    for i, keyword_ids in enumerate(lexical):
+        vector_ids = [ids[r] for r, _ in exact_store.search_by_vector(vectors[i], candidates)]
+        vector_hits.append(ids[picks[i]] in vector_ids[:args.k])
+        hybrid_hits.append(ids[picks[i]] in lexical_index.reciprocal_rank_fusion([vector_ids, keyword_ids])[:args.k])
+    print(f"\nsource chunk in top {args.k}: vector {np.mean(vector_hits):.3f}, hybrid {np.mean(hybrid_hits):.3f} "
+          f"(BM25 search {lexical_ms.mean():.2f}ms mean, {np.percentile(lexical_ms, 95):.2f}ms p95)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Running header/footer and duplicate-page removal.
+
+Textbooks print the same lines at the top and bottom of nearly every page: running
+chapter titles, the book title, page numbers, copyright footers. Left in, they end up
+in every chunk, bloat the index and waste prompt tokens. This stage runs on the raw
+page text before splitting and strips edge lines that repeat across neighbouring
+pages, then drops pages that are near-duplicates of an earlier page (rescanned or
+repeated pages).
+
+Pages are streamed: a page is released once the REPEAT_WINDOW pages after it have
+been seen, so memory stays flat for any book length.
+"""
+import hashlib
+import re
+from collections import Counter, deque
+
+import numpy as np
+
+EDGE_LINES = 3          # lines at the top and at the bottom of a page checked for boilerplate
+MAX_EDGE_LINE_CHARS = 120
+REPEAT_WINDOW = 8       # pages on each side of a page in which repeats are counted
+MIN_REPEATS = 3         # an edge line found on this many pages of the window is boilerplate
+DUP_MIN_WORDS = 40      # shorter pages are never treated as duplicates
+DUP_MAX_DISTANCE = 3    # simhash bits two pages may differ in and still count as duplicates
+
+
+def _normalize(line):
+    """Canonical form of an edge line: page numbers and punctuation don't count."""
+    line = re.sub(r'\d+', '#', line.lower())
+    return re.sub(r'[^\w#]+', ' ', line).strip()
+
+
+def _edge_indices(lines):
+    """Indices of the first and last EDGE_LINES non-empty lines of a page."""
+    filled = [k for k, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def _edge_keys(text):
+    lines = text.split('\n')
+    return {_normalize(lines[k]) for k in _edge_indices(lines)
+            if len(lines[k].strip()) <= MAX_EDGE_LINE_CHARS and _normalize(lines[k])}
+
+
+def mask_edge_numbers(text):
+    """Replaces the numbers in a page's edge lines by '#', so a printed page number doesn't change the page."""
+    lines = text.split('\n')
+    for k in _edge_indices(lines):
+        lines[k] = re.sub(r'\d+', '#', lines[k])
+    return '\n'.join(lines)
+
+
+def _simhash(words):
+    """64-bit SimHash of a page's 3-word shingles."""
+    shingles = {" ".join(words[k:k + 3]) for k in range(len(words) - 2)}
+    hashes = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                       for s in shingles], dtype=np.uint64)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    majority = (bits.sum(axis=0) * 2 > len(hashes)).astype(np.uint8)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+class BoilerplateFilter:
+    """
+    Strips repeated header/footer lines and near-duplicate pages from a page stream.
+    Counters (lines_removed, chars_removed, pages_dropped) accumulate over the run.
+    """
+
+    def __init__(self):
+        self.lines_removed = 0
+        self.chars_removed = 0
+        self.pages_dropped = 0
+        self._fingerprints = []
+
+    def strip(self, pages):
+        """
+        Takes (page_idx, raw_text, ...) tuples in page order and yields
+        ((page_idx, stripped_text, ...), raw_text); any further fields pass through
+        unchanged. Dropped duplicate pages come back with empty text.
+        """
+        counts = Counter()
+        history = deque()  # edge keys of the pages already released, newest last
+        pending = deque()  # (page, edge keys) still waiting for look-ahead
+
+        for page in pages:
+            keys = _edge_keys(page[1])
+            counts.update(keys)
+            pending.append((page, keys))
+            if len(pending) > REPEAT_WINDOW:
+                yield self._release(pending, history, counts)
+        while pending:
+            yield self._release(pending, history, counts)
+
+    def _release(self, pending, history, counts):
+        page, keys = pending.popleft()
+        text = page[1]
+        stripped = self._strip_edges(text, counts)
+        stripped = self._drop_if_duplicate(stripped)
+
+        history.append(keys)
+        if len(history) > REPEAT_WINDOW:
+            counts.subtract(history.popleft())
+        return (page[0], stripped) + tuple(page[2:]), text
+
+    def _strip_edges(self, text, counts):
+        lines = text.split('\n')
+        drop = {k for k in _edge_indices(lines)
+                if counts[_normalize(lines[k])] >= MIN_REPEATS and _normalize(lines[k])}
+        if not drop:
+            return text
+        self.lines_removed += len(drop)
+        self.chars_removed += sum(len(lines[k]) for k in drop)
+        return '\n'.join(line for k, line in enumerate(lines) if k not in drop).strip('\n')
+
+    def _drop_if_duplicate(self, text):
+        words = re.findall(r'\w+', text.lower())
+        if len(words) < DUP_MIN_WORDS:
+            return text
+        fingerprint = _simhash(words)
+        if any((fingerprint ^ seen).bit_count() <= DUP_MAX_DISTANCE for seen in self._fingerprints):
+            self.pages_dropped += 1
+            self.chars_removed += len(text)
+            return ""
+        self._fingerprints.append(fingerprint)
+        return text
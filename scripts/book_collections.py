@@ -0,0 +1,183 @@
+"""
+Per-book Chroma collections.
+
+Every book's chunks live in a collection of their own, so a search, chapter scan or
+quiz fetch only walks the selected book's index, and deleting a book drops its
+collection instead of running a filtered delete over the whole library. Collection
+names are derived from the book's filename; the filename itself is stored in the
+collection metadata, which makes the collections themselves the registry of indexed
+books.
+
+Databases built before this kept all books in one "langchain" collection filtered by
+`source`. `migrate` copies those chunks, vectors included, into per-book collections
+and then drops the old collection; the app runs it once on start-up when needed.
+
+Usage:
+    python scripts/book_collections.py list
+    python scripts/book_collections.py migrate
+    python scripts/book_collections.py drop --source "Anatomie.pdf"
+"""
+import argparse
+import hashlib
+import threading
+
+import chromadb
+from chromadb.api.shared_system_client import SharedSystemClient
+from chromadb.errors import NotFoundError
+
+import ingest_state
+
+CHROMA_PATH = "chroma_db"
+LEGACY_COLLECTION = "langchain"
+COLLECTION_PREFIX = "book_"
+
+# Client start-up isn't thread-safe when several books are ingested in one process
+_CLIENT_LOCK = threading.Lock()
+_seen_version = None  # ingest_state.store_version() when refresh_client last looked
+
+
+def get_client():
+    with _CLIENT_LOCK:
+        return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+def refresh_client():
+    """
+    Makes the next get_client() re-open the store if any book's ingestion state changed
+    since the last call. Chroma keeps one shared system per path and process, and that
+    system never sees writes made by another process (the ingestion worker): counts
+    change but queries keep serving the old index. A fresh system reads the current
+    store. Collections opened before keep their old system, so callers must re-open
+    them when this returns True. Only for processes that read while another one
+    writes; the writers themselves never need it.
+    """
+    global _seen_version
+    version = ingest_state.store_version()
+    with _CLIENT_LOCK:
+        changed = _seen_version is not None and version != _seen_version
+        _seen_version = version
+        if changed:
+            SharedSystemClient.clear_system_cache()
+    return changed
+
+
+def collection_name(source):
+    """Returns the Chroma collection name for a book (valid whatever characters the filename holds)."""
+    return COLLECTION_PREFIX + hashlib.sha1(source.encode("utf-8")).hexdigest()[:24]
+
+
+def get_collection(source, create=True):
+    """
+    Returns the raw Chroma collection of a book. With create=False a missing
+    collection raises chromadb.errors.NotFoundError.
+    """
+    client = get_client()
+    if create:
+        return client.get_or_create_collection(collection_name(source), metadata={"source": source})
+    return client.get_collection(collection_name(source))
+
+
+def list_books():
+    """Returns {source: collection} for every book that has a collection."""
+    books = {}
+    for collection in get_client().list_collections():
+        if collection.name.startswith(COLLECTION_PREFIX) and (collection.metadata or {}).get("source"):
+            books[collection.metadata["source"]] = collection
+    return books
+
+
+def drop_book(source):
+    """Deletes a book's collection. Returns False if it had none."""
+    try:
+        get_client().delete_collection(collection_name(source))
+    except NotFoundError:
+        return False
+    return True
+
+
+def legacy_collection():
+    """Returns the old shared "langchain" collection, or None once it has been migrated."""
+    try:
+        return get_client().get_collection(LEGACY_COLLECTION)
+    except NotFoundError:
+        return None
+
+
+def migrate(batch_size=2000, keep_legacy=False, progress_callback=None):
+    """
+    Copies every chunk of the shared "langchain" collection into its book's collection,
+    keeping IDs, vectors and metadata, then drops the shared collection. Safe to rerun
+    after an interruption: chunks are upserted under their existing IDs.
+
+    Args:
+        batch_size: Records copied per Chroma call.
+        keep_legacy: Keep the shared collection after copying.
+        progress_callback: Optional callback(pct, message).
+
+    Returns:
+        {source: chunks copied}.
+    """
+    legacy = legacy_collection()
+    if legacy is None:
+        return {}
+    total = legacy.count()
+    targets, copied, offset = {}, {}, 0
+    while offset < total:
+        records = legacy.get(include=["metadatas", "documents", "embeddings"], limit=batch_size, offset=offset)
+        if not records["ids"]:
+            break
+        offset += len(records["ids"])
+
+        by_source = {}
+        for k, meta in enumerate(records["metadatas"]):
+            by_source.setdefault((meta or {}).get("source") or "unknown.pdf", []).append(k)
+        for source, rows in by_source.items():
+            if source not in targets:
+                targets[source] = get_collection(source)
+            targets[source].upsert(ids=[records["ids"][k] for k in rows],
+                                   embeddings=[records["embeddings"][k] for k in rows],
+                                   metadatas=[records["metadatas"][k] for k in rows],
+                                   documents=[records["documents"][k] for k in rows])
+            copied[source] = copied.get(source, 0) + len(rows)
+        if progress_callback:
+            progress_callback(offset / total, f"📦 Moved {offset} of {total} chunks into per-book collections...")
+
+    if not keep_legacy:
+        get_client().delete_collection(LEGACY_COLLECTION)
+    for source, count in sorted(copied.items()):
+        print(f"Migrated {count} chunks of '{source}'.")
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and migrate the per-book Chroma collections.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List indexed books and their collections")
+    migrate_p = sub.add_parser("migrate", help="Move the shared 'langchain' collection into per-book collections")
+    migrate_p.add_argument("--keep-legacy", action="store_true", help="Don't drop the shared collection afterwards")
+    drop_p = sub.add_parser("drop", help="Delete a book's collection")
+    drop_p.add_argument("--source", required=True, help="Book filename, e.g. Anatomie.pdf")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        books = list_books()
+        legacy = legacy_collection()
+        if not books and legacy is None:
+            print("No collections yet.")
+        for source, collection in sorted(books.items()):
+            print(f"{collection.name}  {collection.count():>7} chunks  {source}")
+        if legacy is not None:
+            print(f"\nShared '{LEGACY_COLLECTION}' collection still holds {legacy.count()} chunks — "
+                  f"run `python scripts/book_collections.py migrate`.")
+    elif args.command == "migrate":
+        if legacy_collection() is None:
+            print("Nothing to migrate.")
+            return
+        copied = migrate(keep_legacy=args.keep_legacy)
+        print(f"Moved {sum(copied.values())} chunks of {len(copied)} book(s).")
+    else:
+        print("Dropped." if drop_book(args.source) else f"'{args.source}' has no collection.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,98 @@
+import hashlib
 import os
+import queue
 import re
+import threading
+import time
 import fitz  # PyMuPDF
+import numpy as np
 import pytesseract
 from PIL import Image
-import io
+import itertools
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from dotenv import load_dotenv
+import book_collections
+import embedding_cache
+import lexical_index
+import ocr_cache
+import ingest_state
+from boilerplate import REPEAT_WINDOW, BoilerplateFilter, mask_edge_numbers
 
 load_dotenv()
-CHROMA_PATH = "chroma_db"
+CHROMA_PATH = book_collections.CHROMA_PATH
 
+# OCR settings. OCR_WORKERS can be overridden per run or via the environment.
+# OCR_ZOOM "auto" picks the render zoom per page (see _choose_zoom); a number forces it.
+OCR_ZOOM = os.environ.get("OCR_ZOOM", "auto")
+OCR_DEFAULT_ZOOM = 2.0
+OCR_MIN_ZOOM, OCR_MAX_ZOOM = 1.5, 4.0
+# Tesseract is most accurate when body text is roughly this many pixels high (~10pt at 300 DPI).
+OCR_TARGET_TEXT_PX = 40
+# Renders whose sampled pixel standard deviation is below this are treated as blank pages.
+BLANK_PAGE_STD = 4.0
+OCR_LANG = "nld"
+# Selective re-OCR: read pages at OCR_FAST_SCALE × zoom first; text blocks whose mean word
+# confidence is below OCR_MIN_CONFIDENCE are re-read at OCR_RETRY_SCALE × zoom with --psm OCR_RETRY_PSM.
+SELECTIVE_OCR = os.environ.get("SELECTIVE_OCR", "1") != "0"
+OCR_MIN_CONFIDENCE = float(os.environ.get("OCR_MIN_CONFIDENCE", 70))
+OCR_FAST_SCALE = 0.7
+OCR_RETRY_SCALE = 1.5
+OCR_RETRY_PSM = 6
+# Render settings that change OCR output; part of the OCR cache key.
+OCR_RENDER_KEY = f"{OCR_ZOOM}/selective" if SELECTIVE_OCR else str(OCR_ZOOM)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+# Extracted page text is flushed to the OCR cache every this many pages.
+CACHE_FLUSH_PAGES = 25
+# Pages per streaming batch (extract → split → embed → upsert). 0 ingests the book in one go.
+INGEST_BATCH_PAGES = int(os.environ.get("INGEST_BATCH_PAGES", 25))
+# Pages whose native text layer has at least this many characters skip Tesseract.
+NATIVE_TEXT_MIN_CHARS = 200
+# Scanned books: OCR whole pages during the chapter scan and keep the text for embedding
+SINGLE_PASS_SCAN = os.environ.get("SINGLE_PASS_SCAN", "1") != "0"
+HEADING_LINES = 5  # first OCR lines of a page searched for a chapter heading
+# Strip running headers/footers and near-duplicate pages before splitting (see boilerplate.py)
+STRIP_BOILERPLATE = os.environ.get("STRIP_BOILERPLATE", "1") != "0"
 
-def detect_chapters(pdf_file_or_path):
+# Embedding settings. EMBED_THREADS caps ONNX Runtime's intra-op threads (unset = ONNX default,
+# all cores); lower it when OCR workers run alongside so the two stages don't oversubscribe.
+EMBED_MODEL = "BAAI/bge-small-en-v1.5"
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 256))
+EMBED_THREADS = int(os.environ["EMBED_THREADS"]) if os.environ.get("EMBED_THREADS") else None
+# Split page batches buffered between the extraction thread and the embedder.
+EMBED_QUEUE_BATCHES = int(os.environ.get("EMBED_QUEUE_BATCHES", 2))
+# Reuse vectors of chunk texts embedded before, by any book (see embedding_cache.py)
+EMBED_CACHE = os.environ.get("EMBED_CACHE", "1") != "0"
+
+
+def detect_chapters(pdf_file_or_path, progress_callback=None, source=None, single_pass=SINGLE_PASS_SCAN, workers=None):
     """
     Detects chapter headings in a PDF.
-    For born-digital PDFs, uses native text extraction. For scanned/image-based PDFs,
-    falls back to a lightweight OCR pass on the top 15% of each page.
+    If the PDF carries an outline (or per-chapter page labels), its entries are used
+    directly and no page is scanned. For born-digital PDFs, uses native text extraction. For scanned/image-based PDFs,
+    falls back to OCR: in single-pass mode every page is OCR'd in full (in parallel,
+    through the OCR cache) and headings are read from its first lines, so the later
+    Embed step replays the cached text instead of OCRing the book a second time.
+    Otherwise only the top 20% of each page is OCR'd.
     Returns a list of {"name": ..., "start_page": ...} dicts sorted by page (1-indexed).
+
+    Args:
+        progress_callback: Optional progress(pct, message) function for the full-page OCR pass.
+        source: Book filename the cached pages are listed under (defaults to the file's name).
+        single_pass: OCR full pages once instead of top strips only.
+        workers: Number of OCR processes for the single-pass scan (defaults to OCR_WORKERS).
     """
-    if isinstance(pdf_file_or_path, str):
-        doc = fitz.open(pdf_file_or_path)
-    else:
-        pdf_bytes = pdf_file_or_path.read()
+    if source is None:
+        name = pdf_file_or_path if isinstance(pdf_file_or_path, str) else getattr(pdf_file_or_path, "name", None)
+        source = os.path.basename(name) if name else None
+    doc, pdf_source = _open_pdf(pdf_file_or_path)
+    if hasattr(pdf_file_or_path, "seek"):
         pdf_file_or_path.seek(0)  # reset for the later full OCR pass
-        doc = fitz.open("pdf", pdf_bytes)
 
     # Only match lines that start with 'Hoofdstuk'
     CHAPTER_KEYWORDS = re.compile(
@@ -36,6 +102,12 @@ def detect_chapters(pdf_file_or_path):
 
     total_pages = len(doc)
 
+    # Pass 0: the PDF's own outline or page labels, when present, give exact chapter starts
+    chapters = _chapters_from_outline(doc) or _chapters_from_page_labels(doc)
+    if chapters:
+        print(f"[detect_chapters] Using the PDF's built-in structure — {len(chapters)} chapters, no page scan needed.")
+        return chapters, total_pages
+
     # Pass 1: attempt native text extraction
     native_text_found = False
     font_size_counts = {}
@@ -62,28 +134,22 @@ def detect_chapters(pdf_file_or_path):
                 if line_text and line_size > 0:
                     all_spans.append((page_num, line_size, line_text))
 
-    # Pass 2: image-based PDF — OCR the top strip of each page
+    # Pass 2: image-based PDF — OCR the page headings
     if not native_text_found:
-        print("[detect_chapters] Image-based PDF detected — running top-strip OCR scan...")
+        if single_pass:
+            print("[detect_chapters] Image-based PDF detected — OCRing full pages once (text is cached for the Embed step)...")
+        else:
+            print("[detect_chapters] Image-based PDF detected — running top-strip OCR scan...")
         ocr_chapters = []
         seen_pages = set()
         seen_names = set()
 
-        for page_idx in tqdm(range(len(doc)), desc="Quick Chapter Scan"):
-            page = doc[page_idx]
-            page_num = page_idx + 1
-            rect = page.rect
-
-            # Only crop the top 20% of the page — headings live here
-            top_strip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * 0.20)
-            clip_page = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), clip=top_strip, alpha=False)
-            img = Image.open(io.BytesIO(clip_page.tobytes("jpeg")))
-            text = pytesseract.image_to_string(img, lang='nld').strip()
-
-            if not text:
-                continue
+        if single_pass:
+            page_heads = _iter_page_heads_full(doc, pdf_source, source, progress_callback, workers)
+        else:
+            page_heads = _iter_page_heads_top_strip(doc)
 
-            lines = [l.strip() for l in text.split('\n') if l.strip()]
+        for page_num, lines in page_heads:
             for line in lines:
                 # Must START with Hoofdstuk
                 has_keyword = bool(CHAPTER_KEYWORDS.match(line))
@@ -164,120 +230,1137 @@ def detect_chapters(pdf_file_or_path):
     return chapters, total_pages
 
 
-def process_pdf(pdf_file_or_path=None, progress_callback=None, source="book.pdf", chapter_map=None):
+def _with_intro(chapters):
+    """Sorts chapters by start page and makes sure page 1 belongs to one."""
+    chapters = sorted(chapters, key=lambda x: x["start_page"])
+    if chapters[0]["start_page"] != 1:
+        chapters.insert(0, {"name": "Preface / Intro", "start_page": 1})
+    return chapters
+
+
+def _chapters_from_outline(doc):
     """
-    OCRs every page of a PDF and tags each chunk with the correct chapter.
+    Maps the PDF outline (bookmarks) to chapters. Uses the outline level that holds the
+    'Hoofdstuk' entries, otherwise the shallowest level with more than one entry, so
+    part/section bookmarks above or below the chapters are ignored.
+    Returns None if the PDF has no usable outline, i.e. fewer than two chapters (a lone
+    "Cover" bookmark would otherwise make the whole book one chapter).
+    """
+    toc = [(level, re.sub(r'\s+', ' ', title).strip(), page)
+           for level, title, page in doc.get_toc(simple=True)
+           if title.strip() and 1 <= page <= len(doc)]
+    if not toc:
+        return None
 
-    Args:
-        pdf_file_or_path: File path (str) or file-like object.
-        progress_callback: Optional callback(pct, message).
-        source: Filename/identifier embedded in chunk metadata.
-        chapter_map: {page_num: chapter_name}. Defaults to "Unknown Chapter" if None.
+    levels = sorted({level for level, _, _ in toc})
+    chapter_level = next((lvl for lvl in levels
+                          if any(re.match(r'hoofdstuk', t, re.IGNORECASE) for l, t, _ in toc if l == lvl)), None)
+    if chapter_level is None:
+        chapter_level = next((lvl for lvl in levels if sum(1 for l, _, _ in toc if l == lvl) > 1), levels[0])
+
+    chapters, seen_pages = [], set()
+    for level, title, page in toc:
+        if level == chapter_level and page not in seen_pages:
+            seen_pages.add(page)
+            chapters.append({"name": title[:70], "start_page": page})
+    if len(chapters) < 2:
+        return None
+    return _with_intro(chapters)
+
+
+def _chapters_from_page_labels(doc):
+    """
+    Maps page label rules to chapters for books numbered per chapter ("3-1", "3-2", ...):
+    every rule with its own prefix starts a chapter. Returns None if the labels don't
+    split the book that way.
+    """
+    try:
+        rules = doc.get_page_labels()
+    except Exception:
+        return None
+    sections = [(rule["startpage"] + 1, rule.get("prefix", "").strip(" -.:")) for rule in rules]
+    sections = [(page, prefix) for page, prefix in sections if prefix]
+    if len({prefix for _, prefix in sections}) < 2:
+        return None
+
+    chapters = [{"name": f"Hoofdstuk {prefix}" if prefix.isdigit() else prefix, "start_page": page}
+                for page, prefix in sections]
+    return _with_intro(chapters)
+
+
+def _iter_page_heads_top_strip(doc):
+    """Yields (page_num, lines) for each page, OCRing only the top 20% of the page."""
+    for page_idx in tqdm(range(len(doc)), desc="Quick Chapter Scan"):
+        page = doc[page_idx]
+        rect = page.rect
+
+        # Only crop the top 20% of the page — headings live here
+        top_strip = fitz.Rect(rect.x0, rect.y0, rect.x1, rect.y0 + rect.height * 0.20)
+        with _render_gray(page, 2.0, clip=top_strip) as (pix, img):
+            if _is_blank(pix):
+                continue
+            text = pytesseract.image_to_string(img, lang='nld').strip()
+
+        yield page_idx + 1, [l.strip() for l in text.split('\n') if l.strip()]
+
+
+def _iter_page_heads_full(doc, pdf_source, source=None, progress_callback=None, workers=None):
+    """
+    Yields (page_num, lines) for each page from a full-page extraction. The page text
+    goes through the OCR cache, so ingesting the book afterwards costs no second OCR
+    pass. The first HEADING_LINES lines of a page stand in for the top strip.
+    """
+    total_pages = len(doc)
+    workers = max(1, OCR_WORKERS if workers is None else workers)
+    page_texts = _iter_pages_cached(doc, pdf_source, workers, source=source)
+    for i, text, _, _ in tqdm(page_texts, total=total_pages, desc="Chapter Scan (full OCR)"):
+        if progress_callback:
+            progress_callback(i / total_pages, f"🔍 Reading page {i + 1} of {total_pages}...")
+        lines = [l.strip() for l in text.split('\n') if l.strip()]
+        yield i + 1, lines[:HEADING_LINES]
+    if progress_callback:
+        progress_callback(1.0, "✅ Scan complete — page text kept for embedding.")
+
+
+# ── Raster stage ─────────────────────────────────────────────────────────────
+@contextmanager
+def _render_gray(page, zoom, clip=None):
+    """
+    Renders a page (or a clip of it) to 8-bit grayscale and wraps the pixmap's sample
+    buffer as a PIL image without copying or re-encoding it. Yields (pixmap, image).
+    The image borrows the pixmap's memory, so it is closed before the pixmap is freed.
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False, clip=clip)
+    img = Image.frombuffer("L", (pix.width, pix.height), pix.samples_mv, "raw", "L", pix.stride, 1)
+    try:
+        yield pix, img
+    finally:
+        img.close()
+
+
+def _is_blank(pix):
+    """Cheap blank-page check: near-zero pixel variance on a sparse sample of the render."""
+    if pix.width == 0 or pix.height == 0:
+        return True
+    pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return float(pixels[::4, ::4].std()) < BLANK_PAGE_STD
+
+
+def _choose_zoom(page):
+    """
+    Picks a render zoom so body text lands near OCR_TARGET_TEXT_PX pixels. Uses the
+    median font size of any text spans on the page, otherwise the resolution of the
+    scanned image (rendering above the scan's own DPI adds nothing).
+    """
+    sizes = [span["size"]
+             for block in page.get_text("dict").get("blocks", []) if block.get("type") == 0
+             for line in block.get("lines", []) for span in line.get("spans", [])
+             if span.get("text", "").strip() and span.get("size", 0) > 0]
+    if sizes:
+        zoom = OCR_TARGET_TEXT_PX / float(np.median(sizes))
+    else:
+        images = [img for img in page.get_image_info() if img.get("width") and img["bbox"][2] > img["bbox"][0]]
+        if not images:
+            return OCR_DEFAULT_ZOOM
+        largest = max(images, key=lambda img: (img["bbox"][2] - img["bbox"][0]) * (img["bbox"][3] - img["bbox"][1]))
+        zoom = largest["width"] / (largest["bbox"][2] - largest["bbox"][0])  # image pixels per PDF point
+    return min(max(zoom, OCR_MIN_ZOOM), OCR_MAX_ZOOM)
+
+
+def _ocr_data(img, lang, config=""):
+    return pytesseract.image_to_data(img, lang=lang, config=config, output_type=pytesseract.Output.DICT)
+
+
+def _ocr_blocks(data):
+    """
+    Groups Tesseract's per-word output into text blocks in reading order. Each block
+    has its text (lines joined by newlines, paragraphs by blank lines), the
+    (confidence, word length) of its words and its pixel bounding box.
+    """
+    blocks = {}
+    for k, word in enumerate(data["text"]):
+        word = word.strip()
+        if not word:
+            continue
+        block = blocks.setdefault(data["block_num"][k], {"lines": {}, "confs": [], "box": [2 ** 31, 2 ** 31, 0, 0]})
+        block["lines"].setdefault((data["par_num"][k], data["line_num"][k]), []).append(word)
+        if float(data["conf"][k]) >= 0:
+            block["confs"].append((float(data["conf"][k]), len(word)))
+        left, top = data["left"][k], data["top"][k]
+        box = block["box"]
+        box[0], box[1] = min(box[0], left), min(box[1], top)
+        box[2], box[3] = max(box[2], left + data["width"][k]), max(box[3], top + data["height"][k])
+
+    for block in blocks.values():
+        paragraphs = {}
+        for (par, _), words in block["lines"].items():
+            paragraphs.setdefault(par, []).append(" ".join(words))
+        block["text"] = "\n\n".join("\n".join(lines) for lines in paragraphs.values())
+    return list(blocks.values())
+
+
+def _mean_confidence(confs):
+    """Word-length-weighted mean of (confidence, length) pairs, or None without words."""
+    chars = sum(n for _, n in confs)
+    return sum(c * n for c, n in confs) / chars if chars else None
+
+
+def _is_weak(block):
+    """True if a block's confidence is below OCR_MIN_CONFIDENCE. Blocks Tesseract gave no confidence for are kept."""
+    confidence = _mean_confidence(block["confs"])
+    return confidence is not None and confidence < OCR_MIN_CONFIDENCE
+
+
+def _reocr(page, clip, zoom, lang):
+    """OCRs a region again at a higher zoom with the retry page segmentation mode."""
+    with _render_gray(page, zoom, clip=clip) as (pix, img):
+        if _is_blank(pix):
+            return []
+        return _ocr_blocks(_ocr_data(img, lang, f"--psm {OCR_RETRY_PSM}"))
+
+
+def _ocr_page(page, zoom=OCR_ZOOM, lang=OCR_LANG):
+    """
+    Rasterizes a single page and OCRs it. Returns (text, confidence), with confidence
+    the mean Tesseract word confidence (0-100), or ("", None) for blank pages.
+
+    With SELECTIVE_OCR the page is first read at a reduced zoom; only text blocks whose
+    confidence falls below OCR_MIN_CONFIDENCE are rendered again at a higher zoom (the
+    whole page if most of it is below) and kept when the retry reads them better.
+    """
+    if zoom == "auto":
+        zoom = _choose_zoom(page)
+    zoom = float(zoom)
+    fast_zoom = max(zoom * OCR_FAST_SCALE, 1.0) if SELECTIVE_OCR else zoom
+    with _render_gray(page, fast_zoom) as (pix, img):
+        if _is_blank(pix):
+            return "", None
+        blocks = _ocr_blocks(_ocr_data(img, lang))
+
+    if SELECTIVE_OCR and blocks:
+        retry_zoom = min(zoom * OCR_RETRY_SCALE, OCR_MAX_ZOOM)
+        weak = [b for b in blocks if _is_weak(b)]
+        weak_chars = sum(n for b in weak for _, n in b["confs"])
+        all_chars = sum(n for b in blocks for _, n in b["confs"])
+        if weak and weak_chars * 2 > all_chars:
+            # Mostly unreadable: one retry of the whole page beats one per block
+            retry = _reocr(page, None, retry_zoom, lang)
+            if (_mean_confidence([c for b in retry for c in b["confs"]]) or 0) > \
+                    (_mean_confidence([c for b in blocks for c in b["confs"]]) or 0):
+                blocks = retry
+        else:
+            for block in weak:
+                left, top, right, bottom = (v / fast_zoom for v in block["box"])
+                clip = fitz.Rect(page.rect.x0 + left - 4, page.rect.y0 + top - 4,
+                                 page.rect.x0 + right + 4, page.rect.y0 + bottom + 4) & page.rect
+                retry = _reocr(page, clip, retry_zoom, lang)
+                confs = [c for b in retry for c in b["confs"]]
+                if (_mean_confidence(confs) or 0) > _mean_confidence(block["confs"]):
+                    block["text"] = "\n\n".join(b["text"] for b in retry)
+                    block["confs"] = confs
+
+    confidence = _mean_confidence([c for b in blocks for c in b["confs"]])
+    return "\n\n".join(b["text"] for b in blocks), confidence
+
+
+def _native_page_text(page):
+    """Returns the page's text layer, one paragraph per text block."""
+    blocks = page.get_text("blocks", sort=True)
+    return "\n\n".join(b[4].strip() for b in blocks if b[6] == 0 and b[4].strip())
+
+
+def _extract_page(page, force_ocr=False):
+    """
+    Returns (raw_text, method, confidence) for a page. The native text layer is used
+    when it holds enough text (confidence None); image-only and low-text pages fall
+    back to Tesseract.
+    """
+    if not force_ocr:
+        text = _native_page_text(page)
+        if len(text) >= NATIVE_TEXT_MIN_CHARS:
+            return text, "native", None
+    text, confidence = _ocr_page(page)
+    return text, "ocr", confidence
+
+
+def _clean_page_text(text):
+    """Joins wrapped lines while keeping paragraph breaks."""
+    text = text.replace('\n\n', ' [PARAGRAPH_BREAK] ').replace('\n', ' ')
+    return text.replace(' [PARAGRAPH_BREAK] ', '\n\n')
+
+
+# ── Parallel OCR ─────────────────────────────────────────────────────────────
+# Each pool process opens its own copy of the document in the initializer, so
+# only the page index travels to the worker and only the text travels back.
+# The pool is started from a producer thread while ONNX Runtime and Chroma threads are
+# running, and forking such a process can deadlock: workers come from a fork server
+# (spawned on Windows, which has no fork).
+_POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+_worker_doc = None
+_worker_force_ocr = False
+
+
+def _init_ocr_worker(pdf_source, force_ocr=False):
+    """Pool initializer: opens the PDF once per worker process."""
+    global _worker_doc, _worker_force_ocr
+    if isinstance(pdf_source, str):
+        _worker_doc = fitz.open(pdf_source)
+    else:
+        _worker_doc = fitz.open("pdf", pdf_source)
+    _worker_force_ocr = force_ocr
+
+
+def _extract_page_worker(page_idx):
+    """Pool task: extracts one page of the worker's document."""
+    return (page_idx,) + _extract_page(_worker_doc[page_idx], force_ocr=_worker_force_ocr)
+
+
+def _iter_page_texts(doc, pdf_source, workers, page_indices, force_ocr=False):
+    """
+    Yields (page_idx, raw_text, method, confidence) for the given pages, always in page order.
+    With workers > 1 pages are extracted by a process pool; otherwise in this process.
+    """
+    if workers <= 1:
+        for i in page_indices:
+            yield (i,) + _extract_page(doc[i], force_ocr=force_ocr)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_ocr_worker, initargs=(pdf_source, force_ocr),
+                             mp_context=_POOL_CONTEXT) as executor:
+        # Keep a bounded window of pages in flight so finished-but-unconsumed
+        # results can't pile up when the consumer (embedding) is slower than OCR.
+        indices = iter(page_indices)
+        window = deque(executor.submit(_extract_page_worker, i)
+                       for i in itertools.islice(indices, workers * 4))
+        while window:
+            result = window.popleft().result()
+            next_idx = next(indices, None)
+            if next_idx is not None:
+                window.append(executor.submit(_extract_page_worker, next_idx))
+            yield result
+
+
+def _iter_pages_cached(doc, pdf_source, workers, force_ocr=False, use_cache=True, source=None,
+                       first_idx=0, pdf_hash=None, indices=None):
+    """
+    Yields (page_idx, raw_text, method, confidence) for every page from first_idx on (or
+    only the given page indices), in order, replaying pages from the OCR cache and
+    extracting (then caching) only the ones it doesn't have yet. Cached pages that are
+    evicted while the run is going are extracted again in this process.
+    """
+    total_pages = len(doc)
+    cached = {}
+    if use_cache:
+        ocr_cache.init_cache()
+        pdf_hash = pdf_hash or ocr_cache.hash_pdf(pdf_source)
+        cached = ocr_cache.get_cached_methods(pdf_hash, OCR_RENDER_KEY, OCR_LANG)
+        if force_ocr:
+            cached = {i: m for i, m in cached.items() if m == "ocr"}
+        if cached:
+            print(f"OCR cache: {len(cached)} of {total_pages} pages already extracted.")
+
+    indices = range(first_idx, total_pages) if indices is None else sorted(i for i in indices if i >= first_idx)
+    todo = [i for i in indices if i not in cached]
+    workers = max(1, min(workers, len(todo)))
+    extracted = _iter_page_texts(doc, pdf_source, workers, todo, force_ocr=force_ocr)
+    pending, replay = [], {}
+    try:
+        for i in indices:
+            if i in cached:
+                # Cached text is loaded one window at a time to keep memory flat
+                if i not in replay:
+                    replay = ocr_cache.get_pages(pdf_hash, OCR_RENDER_KEY, OCR_LANG, i, i + CACHE_FLUSH_PAGES - 1)
+                if i in replay:
+                    yield (i,) + replay.pop(i)
+                    continue
+                # Evicted by the size cap or pruned since the run started: extract it again
+                page = (i,) + _extract_page(doc[i], force_ocr=force_ocr)
+            else:
+                page = next(extracted)
+            if use_cache:
+                pending.append(page)
+                if len(pending) >= CACHE_FLUSH_PAGES:
+                    ocr_cache.put_pages(pdf_hash, OCR_RENDER_KEY, OCR_LANG, pending, source=source, total_pages=total_pages)
+                    pending = []
+            yield page
+    finally:
+        # Keep whatever was extracted, even if ingestion fails halfway through
+        if use_cache and pending:
+            ocr_cache.put_pages(pdf_hash, OCR_RENDER_KEY, OCR_LANG, pending, source=source, total_pages=total_pages)
+
+
+def _batched(iterable, size):
+    """Yields lists of up to `size` items from an iterable."""
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, size)):
+        yield batch
+
+
+def _open_pdf(pdf_file_or_path):
+    """Opens a PDF given as a path, raw bytes or file-like object. Returns (doc, path_or_bytes)."""
+    if isinstance(pdf_file_or_path, str):
+        return fitz.open(pdf_file_or_path), pdf_file_or_path
+    pdf_bytes = pdf_file_or_path if isinstance(pdf_file_or_path, bytes) else pdf_file_or_path.read()
+    return fitz.open("pdf", pdf_bytes), pdf_bytes
+
+
+def _chapter_for_page(chapter_map, page_num):
+    """
+    Returns the chapter a page belongs to: the chapter with the closest start page at
+    or before it, or the first chapter of the map for pages before any start page.
+    """
+    starts = [p for p in chapter_map if p <= page_num]
+    if not starts:
+        return next(iter(chapter_map.values()))
+    return chapter_map[max(starts)]
+
+
+def iter_page_documents(pdf_file_or_path=None, progress_callback=None, source="book.pdf", chapter_map=None,
+                        workers=None, force_ocr=False, use_cache=True, progress_span=0.80,
+                        start_page=1, pdf_hash=None, strip_boilerplate=STRIP_BOILERPLATE, stats=None,
+                        splitter=None, page_numbers=None):
+    """
+    Yields one chapter-tagged Document per page with text, in page order, as soon as
+    each page has been extracted. Arguments are the same as process_pdf; progress
+    reported through the callback runs from 0 to progress_span. Pages before
+    start_page are skipped (used to resume an interrupted ingestion); page_numbers
+    limits extraction to those pages (used to re-index the pages of a new edition
+    that changed).
+
+    With strip_boilerplate, running headers/footers and near-duplicate pages are
+    removed first (see boilerplate.py). When only part of the book is yielded, the
+    filter still reads every page before it and REPEAT_WINDOW pages after it (from
+    the OCR cache where possible), so the yielded pages come out exactly as in a full
+    build. If a stats dict is given it receives lines_removed, chars_removed,
+    pages_dropped and, when a splitter is given to count them, chunks_removed, for
+    the yielded pages only.
     """
     if pdf_file_or_path is None:
         pdf_file_or_path = f"books/{source}"
 
     print(f"Opening PDF for OCR: {source}")
-    if isinstance(pdf_file_or_path, str):
-        doc = fitz.open(pdf_file_or_path)
-    else:
-        doc = fitz.open("pdf", pdf_file_or_path.read())
+    doc, pdf_source = _open_pdf(pdf_file_or_path)
 
     if chapter_map is None:
         chapter_map = {1: "Unknown Chapter"}
 
-    documents = []
-    current_chapter = next(iter(chapter_map.values()))  # Start with first chapter
     total_pages = len(doc)
+    workers = max(1, OCR_WORKERS if workers is None else workers)
+
+    if page_numbers is None:
+        indices, skipped = None, start_page - 1
+        todo_count = total_pages - skipped
+    else:
+        indices, skipped = [p - 1 for p in page_numbers], 0
+        todo_count = sum(1 for p in page_numbers if p >= start_page)
 
-    print(f"Processing {total_pages} pages...")
-    for i in tqdm(range(total_pages), desc="OCR Pages"):
+    print(f"Processing {todo_count} of {total_pages} pages with {workers} OCR worker(s)...")
+    method_counts = {"native": 0, "ocr": 0}
+    wanted, first_idx = None, start_page - 1
+    if strip_boilerplate and (indices is not None or first_idx > 0):
+        # Repeats are counted over neighbouring pages and duplicates against all earlier
+        # ones, so the filter reads those pages too; only the wanted ones are yielded
+        wanted = set(range(first_idx, total_pages)) if indices is None else {i for i in indices if i >= first_idx}
+        indices, first_idx = range(min(max(wanted, default=-1) + REPEAT_WINDOW + 1, total_pages)), 0
+    page_texts = _iter_pages_cached(doc, pdf_source, workers, force_ocr=force_ocr,
+                                    use_cache=use_cache, source=source,
+                                    first_idx=first_idx, pdf_hash=pdf_hash, indices=indices)
+    boilerplate = BoilerplateFilter()
+    if strip_boilerplate:
+        page_texts = boilerplate.strip(page_texts)
+    else:
+        page_texts = ((page, page[1]) for page in page_texts)
+    chunks_removed = 0
+    # The filter releases each page right before yielding it, so the change in its
+    # counters between two yields belongs to the page just yielded
+    removed = dict.fromkeys(("lines_removed", "chars_removed", "pages_dropped"), 0)
+    seen = dict(removed)
+
+    for (i, text, method, confidence), raw_text in tqdm(page_texts, total=skipped + todo_count, initial=skipped,
+                                                        desc="Extracting Pages"):
+        counters = {key: getattr(boilerplate, key) for key in removed}
+        if wanted is not None and i not in wanted:
+            seen = counters
+            continue
+        for key in removed:
+            removed[key] += counters[key] - seen[key]
+        seen = counters
+        method_counts[method] += 1
         if progress_callback:
-            progress_callback(i / total_pages * 0.80, f"📖 OCRing Page {i+1} of {total_pages}...")
+            label = "text layer" if method == "native" else "OCR"
+            done = skipped + method_counts["native"] + method_counts["ocr"]
+            progress_callback(done / (skipped + todo_count) * progress_span,
+                              f"📖 Page {i+1} of {total_pages} ({label}) — "
+                              f"{method_counts['native']} text layer, {method_counts['ocr']} OCR")
 
         page_num = i + 1  # 1-indexed
 
         # Update chapter if we've hit a boundary
+        current_chapter = _chapter_for_page(chapter_map, page_num)
         if page_num in chapter_map:
-            current_chapter = chapter_map[page_num]
             print(f"\n[INFO] Entered '{current_chapter}' on page {page_num}")
 
-        page = doc[i]
-        zoom = 2.0
-        mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat, alpha=False)
-        img = Image.open(io.BytesIO(pix.tobytes("jpeg")))
-        text = pytesseract.image_to_string(img, lang='nld')
-
-        # Clean up text
-        text = text.replace('\n\n', ' [PARAGRAPH_BREAK] ').replace('\n', ' ')
-        text = text.replace(' [PARAGRAPH_BREAK] ', '\n\n')
+        text = _clean_page_text(text)
+        if splitter is not None and text != raw_text:
+            chunks_removed += _count_chunks(splitter, _clean_page_text(raw_text)) - _count_chunks(splitter, text)
 
         if len(text.strip()) > 50:
-            doc_obj = Document(
-                page_content=text,
-                metadata={"page": page_num, "chapter": current_chapter, "source": source}
-            )
-            documents.append(doc_obj)
+            metadata = {"page": page_num, "chapter": current_chapter, "source": source}
+            if confidence is not None:
+                metadata["ocr_confidence"] = round(confidence, 1)
+            yield Document(page_content=text, metadata=metadata)
+
+    print(f"Extracted {method_counts['native']} pages from the text layer, OCR'd {method_counts['ocr']}.")
+    if strip_boilerplate:
+        print(f"Boilerplate: stripped {removed['lines_removed']} repeated header/footer lines and "
+              f"{removed['pages_dropped']} duplicate pages ({removed['chars_removed']} chars"
+              + (f", {chunks_removed} chunks" if splitter is not None else "") + ").")
+    if stats is not None:
+        stats.update(removed)
+        if splitter is not None:
+            stats["chunks_removed"] = chunks_removed
+
+
+def _count_chunks(splitter, text):
+    """Number of chunks a cleaned page would be split into (0 for pages too short to keep)."""
+    return len(splitter.split_text(text)) if len(text.strip()) > 50 else 0
+
 
-    return documents
+def process_pdf(pdf_file_or_path=None, progress_callback=None, source="book.pdf", chapter_map=None, workers=None,
+                force_ocr=False, use_cache=True):
+    """
+    Extracts the text of every page of a PDF and tags each chunk with the correct chapter.
+    Pages with a usable text layer are read directly; the rest are OCR'd.
+
+    Args:
+        pdf_file_or_path: File path (str) or file-like object.
+        progress_callback: Optional callback(pct, message).
+        source: Filename/identifier embedded in chunk metadata.
+        chapter_map: {page_num: chapter_name}. Defaults to "Unknown Chapter" if None.
+        workers: Number of OCR processes. Defaults to OCR_WORKERS; 1 runs sequentially.
+        force_ocr: OCR every page even if it has a text layer (for broken text layers).
+        use_cache: Replay pages from (and store new pages in) the persistent OCR cache.
+    """
+    return list(iter_page_documents(pdf_file_or_path, progress_callback, source=source, chapter_map=chapter_map,
+                                    workers=workers, force_ocr=force_ocr, use_cache=use_cache))
 
 
-def build_vector_db(pdf_file_or_path=None, progress_callback=None, source="book.pdf", chapter_map=None):
+def build_vector_db(pdf_file_or_path=None, progress_callback=None, source="book.pdf", chapter_map=None, workers=None,
+                    force_ocr=False, use_cache=True, batch_size=INGEST_BATCH_PAGES, resume=False,
+                    incremental=True, embed_batch_size=EMBED_BATCH_SIZE, embed_threads=EMBED_THREADS,
+                    embed_cache=EMBED_CACHE):
     """
     Builds or appends to the ChromaDB vector database for a given PDF.
 
+    Pages are streamed through splitting, embedding and the Chroma upsert in batches,
+    so memory stays flat regardless of book length and the chunks of a book become
+    searchable while the rest of it is still being processed. A checkpoint is
+    committed after every batch (see ingest_state.py). Extraction and splitting run in a
+    background thread that keeps up to EMBED_QUEUE_BATCHES batches queued ahead of the
+    embedder, so OCR of the next pages overlaps with embedding of the current ones. The
+    time and throughput of each stage are logged at the end of the run. Chunk texts
+    already embedded by the same model (in any book or earlier build) take their vector
+    from the embedding cache instead of being embedded again.
+
+    When the book is already indexed from a different PDF (a corrected edition), only
+    pages whose content hash changed are extracted and embedded: chunks of removed or
+    changed pages are deleted, unchanged pages keep their chunks (re-numbered if they
+    moved) and the added/changed/kept page counts are reported.
+
     Args:
         pdf_file_or_path: File path or file-like object.
         progress_callback: callback(pct, message).
         source: PDF filename used in metadata.
         chapter_map: {page_num: chapter_name} from the chapter editor.
+        workers: Number of OCR processes (see process_pdf).
+        force_ocr: OCR every page even if it has a text layer.
+        use_cache: Use the persistent OCR page cache (see scripts/ocr_cache.py).
+        batch_size: Pages per streaming batch. 0 or None embeds the whole book in one go.
+        resume: Continue an interrupted run of the same PDF from its last committed batch.
+        incremental: Re-index only the changed pages of a new edition of an indexed book.
+        embed_batch_size: Chunks per ONNX inference call.
+        embed_threads: ONNX Runtime threads for embedding (None = ONNX default).
+        embed_cache: Read and write the persistent embedding cache.
+
+    Returns:
+        {"source", "pages", "chunks", "seconds", "chars_removed", "chunks_removed"} for
+        this run (pages = pages read, not counting those skipped on resume; *_removed =
+        boilerplate stripped before splitting), "stage_seconds" (busy time per stage) and
+        "embed_cache_hits"/"embed_cache_misses" (chunks reused from / added to the cache),
+        plus "added", "changed", "kept" and "removed" page counts for an incremental
+        re-index; or None if nothing was built.
     """
     if pdf_file_or_path is None and os.path.exists(CHROMA_PATH):
         print(f"Vector Database already exists. Skipping rebuild.")
         return
+    if pdf_file_or_path is None:
+        pdf_file_or_path = f"books/{source}"
+
+    started = time.time()
+    doc, pdf_source = _open_pdf(pdf_file_or_path)
+    total_pages_in_pdf = len(doc)
+    page_hashes = page_content_hashes(doc)
+    doc.close()
+    pdf_hash = ocr_cache.hash_pdf(pdf_source)
+    previous = ingest_state.load_state(source)
+    if chapter_map is None and previous and (resume or incremental):
+        chapter_map = ingest_state.chapter_map_from_state(previous)
+    if chapter_map is None:
+        chapter_map = {1: "Unknown Chapter"}
 
-    documents = process_pdf(pdf_file_or_path, progress_callback, source=source, chapter_map=chapter_map)
+    # A finished book with page hashes, now given a different PDF: diff instead of rebuilding
+    page_diff = None
+    if (incremental and previous and previous.get("status") == "complete"
+            and previous.get("page_hashes") and previous.get("pdf_hash") != pdf_hash):
+        page_diff = _diff_pages(previous["page_hashes"], page_hashes)
 
-    if progress_callback: progress_callback(0.82, "✂️ Splitting text into chunks...")
-    print("\nSplitting text into chunks...")
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=800,
         chunk_overlap=150,
         length_function=len,
         add_start_index=True,
     )
-    chunks = text_splitter.split_documents(documents)
-    print(f"Created {len(chunks)} chunks from {len(documents)} pages.")
 
-    if progress_callback: progress_callback(0.85, "🧠 Loading Embedding Model...")
+    if progress_callback: progress_callback(0.0, "🧠 Loading Embedding Model...")
     print("\nLoading FastEmbed Embeddings...")
-    from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-    embeddings = FastEmbedEmbeddings(model_name="BAAI/bge-small-en-v1.5")
+    embeddings = load_embeddings(embed_batch_size, embed_threads)
+
+    progress = {"pct": 0.0}
+
+    def page_progress(pct, message):
+        progress["pct"] = pct
+        if progress_callback:
+            progress_callback(pct, message)
 
-    if progress_callback: progress_callback(0.90, "💾 Embedding & Saving to Database... (this may take a minute)")
-    print("\nSaving to ChromaDB...")
+    total_pages, total_chunks, pages_read = 0, 0, 0
+    timings = dict.fromkeys(("extract", "split", "embed", "store", "wait"), 0.0)
+    cache_stats = {"hits": 0, "misses": 0}
+    removed = {}  # boilerplate stripped before splitting, filled in by iter_page_documents
+    written = set()  # chunk IDs stored by this run
     try:
-        if os.path.exists(CHROMA_PATH) and pdf_file_or_path is not None:
-            db = Chroma(persist_directory=CHROMA_PATH, embedding_function=embeddings, collection_name="langchain")
-            db.add_documents(chunks)
-            print(f"Appended {len(chunks)} new chunks to existing database.")
+        collection = book_collections.get_collection(source)
+        if page_diff is not None:
+            state = _start_reindex(source, pdf_hash, chapter_map, page_hashes, page_diff)
+            if use_cache:
+                # Kept pages read the same, so their text serves as boilerplate context without OCR
+                ocr_cache.init_cache()
+                copied = ocr_cache.copy_pages(previous["pdf_hash"], pdf_hash, OCR_RENDER_KEY, OCR_LANG,
+                                              {old - 1: new - 1 for old, new in page_diff["kept"].items()},
+                                              source=source, total_pages=total_pages_in_pdf)
+                print(f"OCR cache: reused {copied} unchanged pages of the previous edition.")
+        else:
+            state = _start_checkpoint(collection, source, pdf_hash, chapter_map, total_pages_in_pdf, resume,
+                                      page_hashes)
+        start_page = state["last_page"] + 1
+        # Resumed runs and re-indexes also deleted or moved chunks: rebuild the lexical index once at the end
+        rebuild_lexical = start_page > 1 or state.get("reindex_pages") is not None
+        # A re-index (or its resumed run) only extracts the pages that changed
+        page_numbers = state.get("reindex_pages")
+        if page_numbers is None:
+            pages_read = total_pages_in_pdf - start_page + 1
+        else:
+            pages_read = sum(1 for p in page_numbers if p >= start_page)
+        if start_page > 1:
+            print(f"Resuming '{source}' after page {state['last_page']} ({state['chunks_done']} chunks already embedded).")
+            if progress_callback:
+                progress_callback(0.0, f"⏩ Resuming from page {start_page}...")
+
+        pages = iter_page_documents(pdf_source, page_progress, source=source, chapter_map=chapter_map,
+                                    workers=workers, force_ocr=force_ocr, use_cache=use_cache,
+                                    progress_span=0.95, start_page=start_page, pdf_hash=pdf_hash,
+                                    stats=removed, splitter=text_splitter, page_numbers=page_numbers)
+        for batch, chunks in _split_batches_ahead(pages, text_splitter, batch_size or 2 ** 31, timings):
+            if chunks:
+                t0 = time.perf_counter()
+                texts = [c.page_content for c in chunks]
+                if embed_cache:
+                    vectors = embedding_cache.embed_documents(embeddings, EMBED_MODEL, texts, cache_stats)
+                else:
+                    vectors = embeddings.embed_documents(texts)
+                timings["embed"] += time.perf_counter() - t0
+                t0 = time.perf_counter()
+                written.update(_store_chunks(collection, chunks, vectors,
+                                             lexical_source=None if rebuild_lexical else source))
+                timings["store"] += time.perf_counter() - t0
+            total_pages += len(batch)
+            total_chunks += len(chunks)
+            last_page = batch[-1].metadata["page"]
+
+            # Commit the checkpoint only once the batch is safely in Chroma
+            state["last_page"] = last_page
+            state["pages_done"] += len(batch)
+            state["chunks_done"] += len(chunks)
+            ingest_state.save_state(state)
+
+            print(f"Embedded {len(chunks)} chunks from pages {batch[0].metadata['page']}–{last_page}.")
+            if progress_callback:
+                progress_callback(progress["pct"], f"💾 Saved {state['chunks_done']} chunks (up to page {last_page})...")
+
+        state["status"] = "complete"
+        state.pop("reindex_pages", None)
+        state["boilerplate_chars_removed"] = removed.get("chars_removed", 0)
+        state["boilerplate_chunks_removed"] = removed.get("chunks_removed", 0)
+        if rebuild_lexical:
+            lexical_index.rebuild(source)
         else:
-            db = Chroma.from_documents(
-                chunks,
-                embeddings,
-                persist_directory=CHROMA_PATH,
-                collection_name="langchain"
-            )
-            print(f"Created new database with {len(chunks)} chunks.")
+            # A full build wrote every chunk the book now has; the rest are left over from an earlier build
+            stale = _delete_unwritten(collection, source, written)
+            if stale:
+                print(f"Deleted {stale} chunks of an earlier build of '{source}' that this build no longer produces.")
+        ingest_state.save_state(state)
     except Exception as e:
         print(f"ERROR: Failed to save to ChromaDB: {e}")
         if "tenants" in str(e).lower() or "no such table" in str(e).lower():
             print("Detected schema corruption. Suggestion: Delete 'chroma_db' folder and try again.")
         raise e
 
+    print(f"Saved {total_chunks} chunks from {total_pages} pages to the database.")
+    _log_stage_throughput(timings, total_pages, total_chunks)
+    if embed_cache and total_chunks:
+        print(f"Embedding cache: {cache_stats['hits']} of {total_chunks} chunks reused "
+              f"({cache_stats['hits'] / total_chunks:.0%} hit rate), {cache_stats['misses']} embedded.")
+    stats = {"source": source, "pages": pages_read, "chunks": total_chunks, "seconds": time.time() - started,
+             "chars_removed": removed.get("chars_removed", 0), "chunks_removed": removed.get("chunks_removed", 0),
+             "stage_seconds": {k: round(v, 2) for k, v in timings.items()},
+             "embed_cache_hits": cache_stats["hits"], "embed_cache_misses": cache_stats["misses"]}
+    if state.get("reindex"):
+        stats.update(state["reindex"])
+        print("Re-index: {added} pages added, {changed} changed, {kept} kept, {removed} removed.".format(**state["reindex"]))
     if progress_callback: progress_callback(1.0, "✅ Database Ready!")
+    return stats
+
+
+def load_embeddings(batch_size=EMBED_BATCH_SIZE, threads=EMBED_THREADS):
+    """Returns the FastEmbed model used for ingestion, with the given batch size and ONNX thread count."""
+    from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+    kwargs = {"batch_size": batch_size}
+    if threads:
+        kwargs["threads"] = threads
+    return FastEmbedEmbeddings(model_name=EMBED_MODEL, **kwargs)
+
+
+def _queue_put(q, item, stop):
+    """Puts an item on a bounded queue, giving up once `stop` is set."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _split_batches_ahead(pages, splitter, batch_size, timings):
+    """
+    Yields (page_docs, chunks) batches while a background thread extracts and splits the
+    following ones. Page extraction (OCR in its own processes) and ONNX embedding both
+    release the GIL, so the two stages overlap instead of running back to back.
+    Errors in the extraction thread are re-raised here; stopping early (an error while
+    embedding) stops the thread and closes the page stream.
+    """
+    ready = queue.Queue(maxsize=max(1, EMBED_QUEUE_BATCHES))
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            it = iter(pages)
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                batch = list(itertools.islice(it, batch_size))
+                timings["extract"] += time.perf_counter() - t0
+                if not batch:
+                    break
+                t0 = time.perf_counter()
+                chunks = splitter.split_documents(batch)
+                timings["split"] += time.perf_counter() - t0
+                _queue_put(ready, (batch, chunks), stop)
+        except BaseException as e:
+            _queue_put(ready, e, stop)
+        finally:
+            pages.close()
+            _queue_put(ready, done, stop)
+
+    producer = threading.Thread(target=produce, name="ingest-extract", daemon=True)
+    producer.start()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            item = ready.get()
+            timings["wait"] += time.perf_counter() - t0
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def chunk_id(metadata, text):
+    """
+    Returns the deterministic ID of a chunk: a hash of its source, page, start offset
+    and content. Re-ingesting the same pages produces the same IDs, so writes are
+    idempotent upserts instead of duplicates.
+    """
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    key = f"{metadata.get('source')}|{metadata.get('page')}|{metadata.get('start_index', '')}|{content_hash}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _store_chunks(collection, chunks, vectors, lexical_source=None):
+    """
+    Upserts embedded chunks into the raw Chroma collection under their deterministic IDs,
+    and into the lexical index of `lexical_source` when given. Returns the IDs written.
+    """
+    records = {}
+    for chunk, vector in zip(chunks, vectors):
+        records[chunk_id(chunk.metadata, chunk.page_content)] = (chunk, vector)
+    texts = [c.page_content for c, _ in records.values()]
+    metadatas = [c.metadata for c, _ in records.values()]
+    collection.upsert(ids=list(records), embeddings=[v for _, v in records.values()],
+                      documents=texts, metadatas=metadatas)
+    if lexical_source:
+        lexical_index.add_chunks(lexical_source, list(records), texts, metadatas)
+    return list(records)
+
+
+def _delete_unwritten(collection, source, written, batch_size=5000):
+    """
+    Deletes the chunks of a book that a full build didn't write: those of an earlier
+    build whose extracted text has since changed. Returns the number deleted.
+    """
+    stale, offset = [], 0
+    while True:
+        ids = collection.get(include=[], limit=batch_size, offset=offset)["ids"]
+        if not ids:
+            break
+        offset += len(ids)
+        stale.extend(cid for cid in ids if cid not in written)
+    for start in range(0, len(stale), batch_size):
+        collection.delete(ids=stale[start:start + batch_size])
+    if stale:
+        lexical_index.delete_chunks(source, stale)
+    return len(stale)
+
+
+def _log_stage_throughput(timings, pages, chunks):
+    """Prints busy time and throughput per ingestion stage, for tuning OCR workers and embedding threads."""
+    def rate(n, secs, unit):
+        return f"{n / secs:.1f} {unit}/s" if secs else f"- {unit}/s"
+    print(f"Stages: extract {timings['extract']:.1f}s ({rate(pages, timings['extract'], 'pages')}), "
+          f"split {timings['split']:.1f}s, embed {timings['embed']:.1f}s ({rate(chunks, timings['embed'], 'chunks')}), "
+          f"store {timings['store']:.1f}s ({rate(chunks, timings['store'], 'chunks')}), "
+          f"embedder waited {timings['wait']:.1f}s for pages.")
+
+
+def update_chapter_map(source, chapter_map, progress_callback=None, batch_size=5000):
+    """
+    Re-tags an already embedded book with a new chapter map by rewriting the `chapter`
+    metadata of its Chroma records in place. Chunks carry their page number, so no
+    page is OCR'd or embedded again. Returns the number of chunks whose chapter changed.
+
+    Args:
+        source: PDF filename the chunks were stored under.
+        chapter_map: New {start_page: chapter_name} map.
+        progress_callback: Optional callback(pct, message).
+        batch_size: Records read and updated per Chroma call.
+    """
+    chapter_map = {int(p): name for p, name in chapter_map.items()}
+    collection = book_collections.get_collection(source)
+    total = collection.count()
+
+    changed, seen = 0, 0
+    while seen < total:
+        records = collection.get(include=["metadatas"], limit=batch_size, offset=seen)
+        if not records["ids"]:
+            break
+        seen += len(records["ids"])
+        ids, metadatas = [], []
+        for cid, meta in zip(records["ids"], records["metadatas"]):
+            chapter = _chapter_for_page(chapter_map, int(meta.get("page", 1)))
+            if meta.get("chapter") != chapter:
+                ids.append(cid)
+                metadatas.append({**meta, "chapter": chapter})
+        if ids:
+            collection.update(ids=ids, metadatas=metadatas)
+            lexical_index.set_chapters(source, ids, [m["chapter"] for m in metadatas])
+            changed += len(ids)
+        if progress_callback:
+            progress_callback(seen / total, f"🏷️ Re-tagged {seen} of {total} chunks...")
+
+    # Keep the manifest in step so a later resume or re-index sees the same map. Exports
+    # and caches are versioned on the manifest, so books without one (e.g. migrated from
+    # the shared collection) get one here, or they would never see the re-tag
+    state = ingest_state.load_state(source)
+    if not state:
+        state = ingest_state.new_state(source, None, chapter_map, None)
+        state["status"] = "complete"
+    state["chapter_map"] = [[p, name] for p, name in sorted(chapter_map.items())]
+    ingest_state.save_state(state)
+
+    print(f"Updated the chapter of {changed} of {total} chunks for '{source}'.")
+    if progress_callback:
+        progress_callback(1.0, f"✅ Chapters updated ({changed} chunks re-tagged).")
+    return changed
+
+
+def verify_index(fix=False, batch_size=5000):
+    """
+    Checks every book's Chroma collection for duplicate and orphaned chunks.
+
+    Duplicates are records with the same source, page, start offset and text (the
+    same chunk ID) stored more than once, e.g. from a half-failed run whose chunks were
+    never cleaned up. Orphans are collections of books whose PDF is no longer in
+    books/, chunks filed under another book, and chunks of a page beyond the book's
+    page count in its manifest. Records stored under a random ID by older versions
+    are counted as legacy IDs.
+
+    Args:
+        fix: Delete duplicates and orphans and move legacy records to their chunk ID.
+        batch_size: Records read per Chroma call.
+
+    Returns:
+        {"chunks", "duplicates", "orphaned", "legacy_ids"} counts (before fixing).
+    """
+    books = set(os.listdir("books")) if os.path.isdir("books") else set()
+    report = dict.fromkeys(("chunks", "duplicates", "orphaned", "legacy_ids"), 0)
+    for source, collection in sorted(book_collections.list_books().items()):
+        if source not in books:
+            count = collection.count()
+            report["chunks"] += count
+            report["orphaned"] += count
+            print(f"  orphaned: '{source}' ({count} chunks) is no longer in books/")
+            if fix:
+                book_collections.drop_book(source)
+                lexical_index.remove(source)
+            continue
+        for key, value in _verify_collection(collection, source, fix, batch_size).items():
+            report[key] += value
+
+    print(f"Checked {report['chunks']} chunks: {report['duplicates']} duplicates, {report['orphaned']} orphaned, "
+          f"{report['legacy_ids']} under legacy IDs.")
+    if book_collections.legacy_collection() is not None:
+        print("The shared 'langchain' collection hasn't been migrated yet: run `python scripts/book_collections.py migrate`.")
+    return report
+
+
+def _verify_collection(collection, source, fix, batch_size):
+    """verify_index for one book's collection."""
+    state = ingest_state.load_state(source)
+    pages = state.get("total_pages") if state else None
+
+    groups, orphan_ids, total, offset = {}, [], 0, 0
+    while True:
+        records = collection.get(include=["metadatas", "documents"], limit=batch_size, offset=offset)
+        if not records["ids"]:
+            break
+        offset += len(records["ids"])
+        for record_id, meta, text in zip(records["ids"], records["metadatas"], records["documents"]):
+            total += 1
+            if meta.get("source") != source or (pages and not 1 <= int(meta.get("page", 0)) <= pages):
+                orphan_ids.append(record_id)
+                continue
+            groups.setdefault(chunk_id(meta, text), []).append(record_id)
+
+    duplicate_ids, legacy = [], {}
+    for key, ids in groups.items():
+        keep = key if key in ids else ids[0]
+        duplicate_ids.extend(i for i in ids if i != keep)
+        if keep != key:
+            legacy[keep] = key
+    if duplicate_ids or orphan_ids or legacy:
+        print(f"  '{source}': {len(duplicate_ids)} duplicates, {len(orphan_ids)} orphaned, "
+              f"{len(legacy)} under legacy IDs")
+
+    if fix:
+        for ids in _batched(duplicate_ids + orphan_ids, batch_size):
+            collection.delete(ids=ids)
+        for old_ids in _batched(list(legacy), batch_size):
+            records = collection.get(ids=old_ids, include=["metadatas", "documents", "embeddings"])
+            collection.delete(ids=old_ids)
+            collection.upsert(ids=[legacy[i] for i in records["ids"]], embeddings=records["embeddings"],
+                              metadatas=records["metadatas"], documents=records["documents"])
+        if duplicate_ids or orphan_ids or legacy:
+            lexical_index.rebuild(source)
+    return {"chunks": total, "duplicates": len(duplicate_ids), "orphaned": len(orphan_ids),
+            "legacy_ids": len(legacy)}
+
+
+def page_content_hashes(doc):
+    """
+    Returns a fingerprint per page, computed without rendering or OCR, so a new edition
+    can be diffed page by page. Pages with a text layer are fingerprinted by their text,
+    with the numbers in the edge lines masked: a page that only moved keeps its hash
+    although its printed page number changed. Scanned pages are fingerprinted by their
+    drawing instructions. Embedded images count for both.
+    """
+    hashes = []
+    for page in doc:
+        text = _native_page_text(page)
+        if len(text) >= NATIVE_TEXT_MIN_CHARS:
+            h = hashlib.sha1(mask_edge_numbers(text).encode("utf-8"))
+        else:
+            h = hashlib.sha1(page.read_contents())
+        for image in page.get_images(full=True):
+            h.update(doc.xref_stream_raw(image[0]) or b"")
+        hashes.append(h.hexdigest()[:16])
+    return hashes
+
+
+def _diff_pages(old_hashes, new_hashes):
+    """
+    Matches the pages of a new edition to the indexed one by content hash. Returns
+    {"kept": {old_page: new_page}, "changed": [...], "added": [...], "removed": [...]}
+    with 1-indexed page numbers: changed pages replace an unmatched page at the same
+    number, added pages don't, removed lists every old page without a match.
+    """
+    unmatched_old = {}
+    for page, h in enumerate(old_hashes, start=1):
+        unmatched_old.setdefault(h, []).append(page)
+
+    kept, new_unmatched = {}, []
+    for page, h in enumerate(new_hashes, start=1):
+        if unmatched_old.get(h):
+            kept[unmatched_old[h].pop(0)] = page
+        else:
+            new_unmatched.append(page)
+
+    removed = sorted(p for pages in unmatched_old.values() for p in pages)
+    removed_set = set(removed)
+    changed = [p for p in new_unmatched if p in removed_set]
+    added = [p for p in new_unmatched if p not in removed_set]
+    return {"kept": kept, "changed": changed, "added": added, "removed": removed}
+
+
+def _start_reindex(source, pdf_hash, chapter_map, page_hashes, page_diff):
+    """
+    Applies a page diff to the book's existing chunks and returns a running state that
+    re-extracts only the changed and added pages. Chunks of removed and changed pages
+    are deleted; chunks of kept pages get their new page number and chapter. Chunks
+    whose page number changed are moved to the ID of their new page, reusing their
+    stored vectors.
+    """
+    collection = book_collections.get_collection(source)
+    records = collection.get(include=["metadatas", "documents"])
+    kept = page_diff["kept"]
+    delete_ids, update_ids, update_metas, moved = [], [], [], {}
+    for old_id, meta, text in zip(records["ids"], records["metadatas"], records["documents"]):
+        old_page = int(meta.get("page", 0))
+        if old_page not in kept:
+            delete_ids.append(old_id)
+            continue
+        new_page = kept[old_page]
+        chapter = _chapter_for_page(chapter_map, new_page)
+        if new_page != old_page:
+            new_meta = {**meta, "page": new_page, "chapter": chapter}
+            moved[old_id] = (chunk_id(new_meta, text), new_meta, text)
+        elif meta.get("chapter") != chapter:
+            update_ids.append(old_id)
+            update_metas.append({**meta, "chapter": chapter})
+
+    for ids in _batched(delete_ids, 5000):
+        collection.delete(ids=ids)
+    for ids, metas in zip(_batched(update_ids, 5000), _batched(update_metas, 5000)):
+        collection.update(ids=ids, metadatas=metas)
+    for old_ids in _batched(list(moved), 5000):
+        vectors = collection.get(ids=old_ids, include=["embeddings"])
+        moves = [(moved[i], v) for i, v in zip(vectors["ids"], vectors["embeddings"])]
+        collection.delete(ids=old_ids)
+        collection.upsert(ids=[m[0] for m, _ in moves], embeddings=[v for _, v in moves],
+                          metadatas=[m[1] for m, _ in moves], documents=[m[2] for m, _ in moves])
+
+    state = ingest_state.new_state(source, pdf_hash, chapter_map, len(page_hashes))
+    state["page_hashes"] = page_hashes
+    state["reindex_pages"] = sorted(page_diff["changed"] + page_diff["added"])
+    state["reindex"] = {"added": len(page_diff["added"]), "changed": len(page_diff["changed"]),
+                        "kept": len(kept), "removed": len(page_diff["removed"]) - len(page_diff["changed"])}
+    ingest_state.save_state(state)
+    print(f"Re-indexing '{source}': {len(state['reindex_pages'])} of {len(page_hashes)} pages changed or added; "
+          f"deleted {len(delete_ids)} stale chunks, re-numbered {len(moved)}.")
+    return state
+
+
+def _start_checkpoint(collection, source, pdf_hash, chapter_map, total_pages, resume, page_hashes=None):
+    """
+    Returns the ingestion state to continue from. A resumable run of the same PDF and
+    chapter map continues after its last committed batch, after dropping chunks of the
+    batch that was in flight when it stopped. Otherwise any partial run is discarded
+    and a fresh state is started.
+    """
+    previous = ingest_state.load_state(source)
+    if previous and previous.get("status") != "complete":
+        same_job = (previous.get("pdf_hash") == pdf_hash
+                    and ingest_state.chapter_map_from_state(previous) == chapter_map)
+        if resume and same_job:
+            # Drop the chunks of the batch that was in flight; a re-index only owns its own pages
+            in_flight = {"page": {"$gt": previous["last_page"]}}
+            if previous.get("reindex_pages") is not None:
+                in_flight = {"page": {"$in": [p for p in previous["reindex_pages"] if p > previous["last_page"]] or [-1]}}
+            collection.delete(where=in_flight)
+            return previous
+        if resume:
+            print(f"Checkpoint for '{source}' is for a different PDF or chapter map. Starting over.")
+        # Remove the chunks of the unfinished run before starting again from page 1
+        collection.delete(where={"source": source})
+        lexical_index.remove(source)
+
+    state = ingest_state.new_state(source, pdf_hash, chapter_map, total_pages)
+    if page_hashes is not None:
+        state["page_hashes"] = page_hashes
+    ingest_state.save_state(state)
+    return state
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="OCR a PDF textbook and add it to the vector database.")
+    parser.add_argument("pdf", nargs="?", help="PDF to ingest. Without it, builds books/book.pdf if no database exists yet.")
+    parser.add_argument("--source", help="Name stored in chunk metadata (defaults to the PDF's filename)")
+    parser.add_argument("--chapters", help='JSON file with the chapter map, e.g. {"1": "Inleiding", "14": "Hoofdstuk 1"}')
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run from its last checkpoint")
+    parser.add_argument("--verify", action="store_true", help="Report duplicate and orphaned chunks in the database")
+    parser.add_argument("--fix", action="store_true", help="With --verify: delete them and re-key legacy chunk IDs")
+    parser.add_argument("--update-chapters", action="store_true",
+                        help="Only re-tag the already embedded book with --chapters (no OCR, no embedding)")
+    parser.add_argument("--workers", type=int, default=None, help=f"OCR processes (default {OCR_WORKERS})")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_PAGES, help="Pages per embedding batch")
+    parser.add_argument("--force-ocr", action="store_true", help="OCR every page, ignoring the text layer")
+    parser.add_argument("--no-cache", action="store_true", help="Don't read or write the OCR page cache")
+    parser.add_argument("--embed-batch-size", type=int, default=EMBED_BATCH_SIZE,
+                        help=f"Chunks per embedding call (default {EMBED_BATCH_SIZE})")
+    parser.add_argument("--embed-threads", type=int, default=EMBED_THREADS,
+                        help="ONNX Runtime threads for embedding (default: ONNX decides)")
+    parser.add_argument("--no-embed-cache", action="store_true",
+                        help="Embed every chunk, without reading or writing the embedding cache")
+    args = parser.parse_args()
+
+    if args.verify:
+        verify_index(fix=args.fix)
+        return
+    if not args.pdf:
+        build_vector_db()
+        return
+
+    chapter_map = None
+    if args.chapters:
+        with open(args.chapters, "r", encoding="utf-8") as f:
+            chapter_map = {int(p): name for p, name in json.load(f).items()}
+
+    if args.update_chapters:
+        if chapter_map is None:
+            parser.error("--update-chapters needs --chapters")
+        update_chapter_map(args.source or os.path.basename(args.pdf), chapter_map)
+        return
+
+    build_vector_db(args.pdf, source=args.source or os.path.basename(args.pdf), chapter_map=chapter_map,
+                    workers=args.workers, force_ocr=args.force_ocr, use_cache=not args.no_cache,
+                    batch_size=args.batch_size, resume=args.resume, embed_batch_size=args.embed_batch_size,
+                    embed_threads=args.embed_threads, embed_cache=not args.no_embed_cache)
 
 
 if __name__ == "__main__":
-    build_vector_db()
+    main()
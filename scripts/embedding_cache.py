@@ -0,0 +1,223 @@
+"""
+Persistent embedding cache shared by all books.
+
+Vectors are keyed by the embedding model and a hash of the chunk text, so re-uploading
+a book, rebuilding chroma_db from scratch or re-chunking only embeds chunk texts that
+were never embedded before. Each model gets its own folder under cache/embeddings/
+holding an append-only float32 matrix (read back as a memmap) and a small SQLite
+index mapping text hashes to matrix rows.
+
+Usage:
+    python scripts/embedding_cache.py list
+    python scripts/embedding_cache.py prune --model "BAAI/bge-small-en-v1.5"
+    python scripts/embedding_cache.py prune --all
+"""
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+
+import numpy as np
+
+CACHE_DIR = os.path.join("cache", "embeddings")
+_SQL_BATCH = 500  # stays below SQLite's bound-parameter limit
+
+
+def text_hash(text):
+    """Returns the hash a chunk text is cached under."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _model_dir(model_name):
+    return os.path.join(CACHE_DIR, re.sub(r'[^\w.-]+', '__', model_name))
+
+
+def _vectors_path(model_name):
+    return os.path.join(_model_dir(model_name), "vectors.f32")
+
+
+def get_connection(model_name):
+    os.makedirs(_model_dir(model_name), exist_ok=True)
+    conn = sqlite3.connect(os.path.join(_model_dir(model_name), "index.db"), timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS vectors (text_hash TEXT PRIMARY KEY, row INTEGER)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def _dim(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+    return int(row[0]) if row else None
+
+
+def _committed_rows(conn):
+    return conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+
+
+def lookup(model_name, hashes):
+    """
+    Returns {text_hash: vector} for the hashes that are cached. Only complete rows
+    committed to the index are mapped, so a tail being appended by another process,
+    or left half-written by a crash, is never read.
+    """
+    hashes = list(dict.fromkeys(hashes))
+    with get_connection(model_name) as conn:
+        dim = _dim(conn)
+        if dim is None or not hashes:
+            return {}
+        committed = _committed_rows(conn)
+        rows = {}
+        for start in range(0, len(hashes), _SQL_BATCH):
+            part = hashes[start:start + _SQL_BATCH]
+            cursor = conn.execute(
+                f"SELECT text_hash, row FROM vectors WHERE text_hash IN ({','.join('?' * len(part))})", part
+            )
+            rows.update(cursor.fetchall())
+    path = _vectors_path(model_name)
+    n_rows = min(committed, os.path.getsize(path) // (4 * dim)) if os.path.exists(path) else 0
+    rows = {h: r for h, r in rows.items() if r < n_rows}
+    if not rows:
+        return {}
+    matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(n_rows, dim))
+    return {h: np.array(matrix[r]) for h, r in rows.items()}
+
+
+def store(model_name, hashes, vectors):
+    """
+    Appends vectors for new text hashes. The SQLite write lock is held while the
+    vectors are written, so concurrent ingestions (threads or processes) never
+    claim the same rows; whatever a run that crashed before committing left after
+    the last committed row, partial rows included, is truncated first.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not len(vectors):
+        return
+    conn = get_connection(model_name)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        dim = _dim(conn)
+        if dim is None:
+            dim = vectors.shape[1]
+            conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+        elif dim != vectors.shape[1]:
+            raise ValueError(f"Embedding cache for {model_name} holds {dim}-dim vectors, got {vectors.shape[1]}")
+
+        known = set()
+        for start in range(0, len(hashes), _SQL_BATCH):
+            part = list(hashes[start:start + _SQL_BATCH])
+            cursor = conn.execute(
+                f"SELECT text_hash FROM vectors WHERE text_hash IN ({','.join('?' * len(part))})", part
+            )
+            known.update(row[0] for row in cursor.fetchall())
+        new = {}
+        for h, vector in zip(hashes, vectors):
+            if h not in known and h not in new:
+                new[h] = vector
+        if not new:
+            conn.rollback()
+            return
+
+        next_row = _committed_rows(conn)
+        path = _vectors_path(model_name)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(next_row * dim * 4)
+            f.seek(next_row * dim * 4)
+            f.write(np.stack(list(new.values())).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        conn.executemany("INSERT INTO vectors (text_hash, row) VALUES (?, ?)",
+                         [(h, next_row + k) for k, h in enumerate(new)])
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def embed_documents(embeddings, model_name, texts, stats=None):
+    """
+    Embeds texts through the cache: only texts not cached for this model are sent to
+    `embeddings.embed_documents`, and their vectors are stored for next time.
+
+    Args:
+        embeddings: LangChain embeddings object for model_name.
+        stats: Optional dict whose "hits" and "misses" counters are incremented.
+
+    Returns:
+        A float32 array with one vector per text.
+    """
+    hashes = [text_hash(t) for t in texts]
+    cached = lookup(model_name, hashes)
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in cached:
+            missing.setdefault(h, text)
+    if missing:
+        vectors = np.asarray(embeddings.embed_documents(list(missing.values())), dtype=np.float32)
+        store(model_name, list(missing), vectors)
+        cached.update(zip(missing, vectors))
+    if stats is not None:
+        stats["hits"] = stats.get("hits", 0) + len(texts) - len(missing)
+        stats["misses"] = stats.get("misses", 0) + len(missing)
+    return np.stack([cached[h] for h in hashes]) if hashes else np.zeros((0, 0), dtype=np.float32)
+
+
+def list_models():
+    """Returns one summary dict per cached model."""
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    models = []
+    for folder in sorted(os.listdir(CACHE_DIR)):
+        index_path = os.path.join(CACHE_DIR, folder, "index.db")
+        if not os.path.exists(index_path):
+            continue
+        with sqlite3.connect(index_path) as conn:
+            count = conn.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+            dim = _dim(conn)
+        vectors_path = os.path.join(CACHE_DIR, folder, "vectors.f32")
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        models.append({"model": folder, "vectors": count, "dim": dim, "bytes": size})
+    return models
+
+
+def prune(model_name=None):
+    """Deletes the cache of one model, or of every model if none is given. Returns the number of models removed."""
+    if model_name:
+        folders = [_model_dir(model_name)]
+    elif os.path.isdir(CACHE_DIR):
+        folders = [os.path.join(CACHE_DIR, f) for f in os.listdir(CACHE_DIR)]
+    else:
+        folders = []
+    removed = 0
+    for folder in folders:
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+            removed += 1
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the embedding cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List cached models")
+    prune_p = sub.add_parser("prune", help="Delete cached vectors")
+    group = prune_p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--model", help="Embedding model name, e.g. BAAI/bge-small-en-v1.5")
+    group.add_argument("--all", action="store_true", help="Empty the whole cache")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        models = list_models()
+        if not models:
+            print("Embedding cache is empty.")
+            return
+        for m in models:
+            print(f"{m['vectors']:>9} vectors  {m['dim'] or '?':>4}-dim  {m['bytes'] / 1024 / 1024:>8.1f} MB  {m['model']}")
+    else:
+        print(f"Removed the cache of {prune(args.model)} model(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Batch ingestion of many books at once.
+
+Takes PDFs, directories and glob patterns, copies each book into books/ (so it shows up
+in the app's Library) and ingests several books side by side under one CPU budget.
+A book's chapter map is read from a JSON file next to it (`Anatomie.json` or
+`Anatomie.pdf.json`, or the same names in --chapters-dir); books without one get their
+chapters detected automatically. Books whose manifest shows the same PDF already fully
+indexed are skipped.
+
+Usage:
+    python scripts/ingest_books.py ~/Textbooks/
+    python scripts/ingest_books.py "shelf/*.pdf" --chapters-dir shelf/chapters --cpus 8 --parallel 2
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ingest_state
+import ocr_cache
+from build_vector_db import build_vector_db, detect_chapters
+
+
+def find_pdfs(inputs):
+    """Expands files, directories and glob patterns into a sorted, de-duplicated list of PDF paths."""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "*.pdf")) + glob.glob(os.path.join(item, "*.PDF"))
+        else:
+            matches = glob.glob(item) or ([item] if os.path.exists(item) else [])
+        if not matches:
+            print(f"[WARN] No PDFs found for '{item}'.")
+        paths.extend(m for m in matches if m.lower().endswith(".pdf"))
+    return sorted(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def load_chapter_map(pdf_path, chapters_dir=None):
+    """Returns the {start_page: name} map from the book's chapter JSON, or None if it has none."""
+    name = os.path.basename(pdf_path)
+    stem = os.path.splitext(name)[0]
+    for folder in filter(None, [chapters_dir, os.path.dirname(pdf_path)]):
+        for candidate in (f"{stem}.json", f"{name}.json"):
+            path = os.path.join(folder, candidate)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    return {int(p): ch for p, ch in json.load(f).items()}
+    return None
+
+
+def is_indexed(source, pdf_hash):
+    """True if the book's manifest shows this exact PDF fully ingested."""
+    state = ingest_state.load_state(source)
+    return bool(state) and state.get("status") == "complete" and state.get("pdf_hash") == pdf_hash
+
+
+def ingest_book(pdf_path, workers, chapters_dir=None, force=False, batch_size=None, embed_threads=None):
+    """
+    Copies one book into books/ and ingests it. Returns a summary dict with a status of
+    "indexed", "skipped" or "failed".
+
+    Args:
+        workers: OCR worker processes for this book.
+        embed_threads: ONNX Runtime threads of this book's embedding model (None: one per core).
+    """
+    source = os.path.basename(pdf_path)
+    summary = {"source": source, "status": "skipped", "pages": 0, "chunks": 0, "seconds": 0.0}
+    try:
+        pdf_hash = ocr_cache.hash_pdf(pdf_path)
+        if not force and is_indexed(source, pdf_hash):
+            print(f"[SKIP] {source} is already indexed.")
+            return summary
+
+        os.makedirs("books", exist_ok=True)
+        book_path = os.path.abspath(os.path.join("books", source))
+        if book_path != pdf_path:
+            shutil.copy2(pdf_path, book_path)
+
+        chapter_map = load_chapter_map(pdf_path, chapters_dir)
+        if chapter_map is None:
+            chapters, _ = detect_chapters(book_path, source=source, workers=workers)
+            chapter_map = {ch["start_page"]: ch["name"] for ch in chapters}
+            print(f"[INFO] {source}: detected {len(chapter_map)} chapters.")
+
+        kwargs = {"batch_size": batch_size} if batch_size is not None else {}
+        # resume=True picks up an interrupted earlier run of the same PDF and chapter map
+        stats = build_vector_db(book_path, source=source, chapter_map=chapter_map, workers=workers,
+                                resume=True, embed_threads=embed_threads, **kwargs)
+        summary.update(stats or {}, status="indexed")
+    except Exception as e:
+        print(f"[ERROR] {source}: {e}")
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+    return summary
+
+
+def split_budget(cpus, parallel):
+    """
+    Splits a CPU budget between the books ingested side by side. OCR and embedding of a
+    book run at the same time, so each book's share is divided between its OCR pool and
+    its embedding threads. Returns (ocr_workers, embed_threads) per book; with a share of
+    one CPU both still get one.
+    """
+    share = max(1, cpus // parallel)
+    embed_threads = max(1, share // 2)
+    return max(1, share - embed_threads), embed_threads
+
+
+def print_summary(results, elapsed, budget=None):
+    print("\n" + "=" * 96)
+    if budget:
+        print("CPU budget {cpus}: {parallel} book(s) at a time, each with {workers} OCR worker(s) "
+              "and {embed_threads} embedding thread(s)".format(**budget))
+    print(f"{'Book':<34} {'Status':<8} {'Pages':>6} {'Chunks':>7} {'Time':>7} {'Pages/s':>7} {'Chunks/s':>8} "
+          f"{'Stripped':>17}")
+    print("-" * 96)
+    for r in results:
+        secs = r["seconds"]
+        pps = f"{r['pages'] / secs:.2f}" if secs else "-"
+        cps = f"{r['chunks'] / secs:.1f}" if secs else "-"
+        stripped = f"{r.get('chars_removed', 0)} ch/{r.get('chunks_removed', 0)} ck"
+        print(f"{r['source'][:34]:<34} {r['status']:<8} {r['pages']:>6} {r['chunks']:>7} {secs:>6.0f}s {pps:>7} {cps:>8} "
+              f"{stripped:>17}")
+    pages = sum(r["pages"] for r in results)
+    chunks = sum(r["chunks"] for r in results)
+    print("-" * 96)
+    print(f"{'Total (wall clock)':<43} {pages:>6} {chunks:>7} {elapsed:>6.0f}s "
+          f"{pages / elapsed if elapsed else 0:>7.2f} {chunks / elapsed if elapsed else 0:>8.1f}")
+    for r in results:
+        if r["status"] == "failed":
+            print(f"[FAILED] {r['source']}: {r.get('error')}")
+
+
+def main():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Ingest a shelf of PDF textbooks into the vector database.")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("--chapters-dir", help="Folder with per-book chapter maps (<book>.json)")
+    parser.add_argument("--cpus", type=int, default=cpu_count, help=f"Total CPU budget (default {cpu_count})")
+    parser.add_argument("--parallel", type=int, default=2, help="Books ingested at the same time (default 2)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Pages per embedding batch")
+    parser.add_argument("--force", action="store_true", help="Re-ingest books that are already indexed")
+    args = parser.parse_args()
+
+    pdfs = find_pdfs(args.inputs)
+    if not pdfs:
+        print("No PDFs to ingest.")
+        sys.exit(1)
+
+    parallel = max(1, min(args.parallel, len(pdfs), args.cpus))
+    workers, embed_threads = split_budget(args.cpus, parallel)
+    print(f"Ingesting {len(pdfs)} book(s), {parallel} at a time with {workers} OCR worker(s) "
+          f"and {embed_threads} embedding thread(s) each.")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(
+            lambda p: ingest_book(p, workers, args.chapters_dir, args.force, args.batch_size, embed_threads), pdfs
+        ))
+    budget = {"cpus": args.cpus, "parallel": parallel, "workers": workers, "embed_threads": embed_threads}
+    print_summary(results, time.time() - started, budget)
+    if any(r["status"] == "failed" for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Durable per-book ingestion state.
+
+One small JSON file per book records the PDF hash, the chapter map and how far
+ingestion got: pages extracted and chunks embedded up to the last committed batch.
+A crashed or interrupted run resumes from there instead of page 1. Once ingestion
+finishes the file stays behind as the book's manifest.
+"""
+import datetime
+import json
+import os
+
+STATE_DIR = os.path.join("books", ".ingest")
+
+
+def _state_path(source):
+    return os.path.join(STATE_DIR, f"{source}.json")
+
+
+def new_state(source, pdf_hash, chapter_map, total_pages):
+    """Returns a fresh 'running' state for a book that starts ingesting from page 1."""
+    return {
+        "source": source,
+        "pdf_hash": pdf_hash,
+        # Stored as [start_page, name] pairs: JSON object keys would turn page numbers into strings
+        "chapter_map": [[int(p), name] for p, name in chapter_map.items()],
+        "total_pages": total_pages,
+        "status": "running",
+        "last_page": 0,
+        "pages_done": 0,
+        "chunks_done": 0,
+    }
+
+
+def chapter_map_from_state(state):
+    """Returns the {start_page: name} chapter map stored in a state."""
+    return {int(p): name for p, name in state.get("chapter_map", [])}
+
+
+def load_state(source):
+    """Returns the stored state for a book, or None if it has never been ingested."""
+    try:
+        with open(_state_path(source), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_state(state):
+    """Atomically writes a book's state so a crash never leaves a half-written checkpoint."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    state["updated_at"] = datetime.datetime.now().isoformat()
+    path = _state_path(state["source"])
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def state_mtime(source):
+    """Returns the modification time (ns) of a book's state file, or None. Changes on every committed write."""
+    try:
+        return os.stat(_state_path(source)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def store_version():
+    """
+    Returns a fingerprint of every book's state file. It changes whenever any book
+    commits an ingestion batch, is re-tagged or has its state removed.
+    """
+    try:
+        with os.scandir(STATE_DIR) as entries:
+            return tuple(sorted((e.name, e.stat().st_mtime_ns) for e in entries if e.name.endswith(".json")))
+    except FileNotFoundError:
+        return ()
+
+
+def clear_state(source):
+    """Removes a book's state file."""
+    try:
+        os.remove(_state_path(source))
+    except FileNotFoundError:
+        pass
+
+
+def is_incomplete(source):
+    """True if a book has an ingestion run that never finished."""
+    state = load_state(source)
+    return bool(state) and state.get("status") != "complete"
@@ -0,0 +1,191 @@
+"""
+Background ingestion worker.
+
+Pulls jobs from the `jobs` table in chat_history.db (queued by the sidebar's Embed and
+Resume buttons) and runs build_vector_db for each one, writing progress back to the
+table for the UI to poll. Ingestion lives outside the Streamlit session, so closing the
+browser doesn't kill it and two uploads never write to chroma_db at the same time.
+
+Jobs run one at a time by default; --max-jobs lets a few books ingest side by side
+in this process. Only one worker runs per app directory: it holds an exclusive lock
+on cache/ingest_worker.lock for as long as it runs, and records its PID for the app.
+
+Usage:
+    python scripts/ingest_worker.py
+    python scripts/ingest_worker.py --max-jobs 2 --exit-when-idle 60
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import db_utils
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+PID_FILE = os.path.join("cache", "ingest_worker.pid")
+LOCK_FILE = os.path.join("cache", "ingest_worker.lock")
+LOG_FILE = os.path.join("cache", "ingest_worker.log")
+POLL_SECONDS = 1.0
+# Workers started by the app exit after this long without work; the next upload starts a new one.
+IDLE_EXIT_SECONDS = int(os.environ.get("INGEST_WORKER_IDLE_EXIT", 300))
+MAX_JOBS = int(os.environ.get("INGEST_MAX_JOBS", 1))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _acquire_worker_lock():
+    """
+    Takes the exclusive worker lock without waiting. Returns the open lock file, to be
+    kept open while the worker runs (the OS releases the lock when the process exits,
+    however it exits), or None if another worker holds it.
+    """
+    os.makedirs(os.path.dirname(LOCK_FILE), exist_ok=True)
+    fd = os.open(LOCK_FILE, os.O_RDWR | os.O_CREAT)
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def worker_pid():
+    """Returns the PID of the running worker, or None if no worker is alive."""
+    try:
+        with open(PID_FILE, "r") as f:
+            pid = int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+    return pid if _pid_alive(pid) else None
+
+
+def ensure_worker():
+    """
+    Starts a detached worker process unless one is already running. Returns its PID.
+    If two sessions start one at the same moment, the one that doesn't get the worker
+    lock exits straight away.
+    """
+    pid = worker_pid()
+    if pid:
+        return pid
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    with open(LOG_FILE, "a") as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--exit-when-idle", str(IDLE_EXIT_SECONDS)],
+            cwd=os.getcwd(), stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+            start_new_session=True,  # survives the Streamlit session that started it
+        )
+    return proc.pid
+
+
+def requeue_orphaned_jobs():
+    """Requeues running jobs whose worker process is gone. They resume from their checkpoint."""
+    for job in db_utils.get_jobs(statuses=("running",)):
+        if job["worker_pid"] != os.getpid() and not (job["worker_pid"] and _pid_alive(job["worker_pid"])):
+            print(f"Requeuing '{job['source']}' (worker {job['worker_pid']} is gone).")
+            db_utils.requeue_job(job["id"])
+
+
+def run_job(job):
+    """Ingests one job's book, reporting progress to the jobs table."""
+    from build_vector_db import build_vector_db
+
+    job_id = job["id"]
+    print(f"▶ {job['source']} (job {job_id[:8]})")
+    started = time.time()
+
+    def update_progress(pct, text):
+        db_utils.update_job_progress(job_id, min(pct, 1.0), text)
+
+    try:
+        # resume=True continues from the book's last checkpoint if one matches
+        build_vector_db(job["pdf_path"], progress_callback=update_progress, source=job["source"],
+                        chapter_map=job["chapter_map"] or None, resume=True)
+    except Exception as e:
+        traceback.print_exc()
+        db_utils.finish_job(job_id, error=str(e) or type(e).__name__)
+        print(f"✗ {job['source']} failed after {time.time() - started:.0f}s: {e}")
+        return
+    db_utils.finish_job(job_id)
+    print(f"✓ {job['source']} done in {time.time() - started:.0f}s")
+
+
+def run_worker(max_jobs=MAX_JOBS, exit_when_idle=None):
+    """
+    Claims and runs queued jobs until stopped (or until idle for exit_when_idle seconds).
+
+    Args:
+        max_jobs: Number of books ingested at the same time.
+        exit_when_idle: Seconds without queued or running jobs after which the worker exits.
+    """
+    # Checking the PID file and then writing it would let two workers start at once
+    lock = _acquire_worker_lock()
+    if lock is None:
+        print(f"Ingestion worker already running (PID {worker_pid()}).")
+        return
+    with open(PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+
+    db_utils.init_db()
+    requeue_orphaned_jobs()
+    print(f"Ingestion worker {os.getpid()} started ({max_jobs} job(s) at a time).")
+
+    running = set()
+    idle_since = time.time()
+    try:
+        with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+            while True:
+                running = {f for f in running if not f.done()}
+                while len(running) < max_jobs:
+                    job = db_utils.claim_next_job(os.getpid())
+                    if not job:
+                        break
+                    running.add(executor.submit(run_job, job))
+
+                if running:
+                    idle_since = time.time()
+                elif exit_when_idle is not None and time.time() - idle_since >= exit_when_idle:
+                    print("No jobs left — exiting.")
+                    break
+                time.sleep(POLL_SECONDS)
+    finally:
+        if worker_pid() == os.getpid():
+            os.remove(PID_FILE)
+        os.close(lock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued book ingestion jobs in the background.")
+    parser.add_argument("--max-jobs", type=int, default=MAX_JOBS,
+                        help="Books ingested at the same time (default: 1; Chroma has a single writer)")
+    parser.add_argument("--exit-when-idle", type=int, default=None, metavar="SECONDS",
+                        help="Exit after this many seconds without jobs (default: run forever)")
+    args = parser.parse_args()
+    run_worker(max_jobs=max(1, args.max_jobs), exit_when_idle=args.exit_when_idle)
+
+
+if __name__ == "__main__":
+    main()
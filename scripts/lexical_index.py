@@ -0,0 +1,196 @@
+"""
+Per-book lexical (BM25) index for hybrid retrieval.
+
+The books are Dutch, but they are embedded with an English model, so exact terms like
+"musculus biceps brachii" can miss in pure vector search. Each book gets an SQLite
+FTS5 index in cache/lexical/<collection>.db holding its chunks as Dutch-stemmed
+tokens (Snowball stemmer from py_rust_stemmers, a fastembed dependency; stopwords
+removed); SQLite ranks matches with BM25. build_vector_db fills it batch by batch
+during ingestion, and the app fuses its ranking with the vector ranking by
+reciprocal rank fusion (RRF).
+
+Usage:
+    python scripts/lexical_index.py rebuild --source "Anatomie.pdf"
+    python scripts/lexical_index.py search --source "Anatomie.pdf" "musculus biceps brachii"
+"""
+import argparse
+import os
+import re
+import sqlite3
+import unicodedata
+
+from py_rust_stemmers import SnowballStemmer
+
+import book_collections
+
+INDEX_DIR = os.path.join("cache", "lexical")
+RRF_K = 60  # rank offset of reciprocal rank fusion; 60 is the usual choice
+
+STOPWORDS = set("""
+aan al alles als altijd andere ben bij daar dan dat de der deze die dit doch doen door dus een eens en er ge
+geen geweest haar had heb hebben heeft hem het hier hij hoe hun iemand iets ik in is ja je kan kon kunnen maar
+me meer men met mij mijn moet na naar niet niets nog nu of om omdat onder ons ook op over reeds te tegen toch
+toen tot u uit uw van veel voor want waren was wat werd wezen wie wil worden wordt zal ze zelf zich zij zijn zo
+zonder zou
+""".split())
+
+_STEMMER = SnowballStemmer("dutch")  # https://snowballstem.org/algorithms/dutch/stemmer.html
+
+
+def tokenize(text):
+    """Lower-cased, accent-folded, stemmed Dutch terms of a text, without stopwords."""
+    text = unicodedata.normalize("NFC", text.lower())
+    return _STEMMER.stem_words([t for t in re.findall(r"[^\W\d_]+|\d+", text)
+                                if t not in STOPWORDS and (len(t) > 1 or t.isdigit())])
+
+
+def _index_path(source):
+    return os.path.join(INDEX_DIR, book_collections.collection_name(source) + ".db")
+
+
+def get_connection(source):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    conn = sqlite3.connect(_index_path(source), timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE, page INTEGER, chapter TEXT)")
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS terms USING fts5(body, tokenize='unicode61 remove_diacritics 0')")
+    return conn
+
+
+def exists(source):
+    return os.path.exists(_index_path(source))
+
+
+def add_chunks(source, chunk_ids, texts, metadatas):
+    """Adds or replaces chunks in a book's index."""
+    with get_connection(source) as conn:
+        _delete(conn, chunk_ids)
+        for chunk_id, text, meta in zip(chunk_ids, texts, metadatas):
+            cursor = conn.execute("INSERT INTO chunks (chunk_id, page, chapter) VALUES (?, ?, ?)",
+                                  (chunk_id, meta.get("page"), meta.get("chapter")))
+            conn.execute("INSERT INTO terms (rowid, body) VALUES (?, ?)", (cursor.lastrowid, " ".join(tokenize(text))))
+        conn.commit()
+
+
+def _delete(conn, chunk_ids):
+    for start in range(0, len(chunk_ids), 500):
+        part = list(chunk_ids[start:start + 500])
+        marks = ",".join("?" * len(part))
+        conn.execute(f"DELETE FROM terms WHERE rowid IN (SELECT id FROM chunks WHERE chunk_id IN ({marks}))", part)
+        conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", part)
+
+
+def delete_chunks(source, chunk_ids):
+    """Deletes chunks from a book's index (no-op for books without an index)."""
+    if not exists(source):
+        return
+    with get_connection(source) as conn:
+        _delete(conn, chunk_ids)
+        conn.commit()
+
+
+def set_chapters(source, chunk_ids, chapters):
+    """Updates the chapter of indexed chunks after a book was re-tagged (no-op for books without an index)."""
+    if not exists(source):
+        return
+    with get_connection(source) as conn:
+        conn.executemany("UPDATE chunks SET chapter = ? WHERE chunk_id = ?", zip(chapters, chunk_ids))
+        conn.commit()
+
+
+def remove(source):
+    """Deletes a book's index."""
+    try:
+        os.remove(_index_path(source))
+    except FileNotFoundError:
+        pass
+
+
+def rebuild(source, batch_size=2000):
+    """Re-creates a book's index from its Chroma collection. Returns the number of chunks indexed."""
+    remove(source)
+    collection = book_collections.get_collection(source, create=False)
+    total, offset = 0, 0
+    while True:
+        records = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not records["ids"]:
+            break
+        offset += len(records["ids"])
+        add_chunks(source, records["ids"], records["documents"], records["metadatas"])
+        total += len(records["ids"])
+    get_connection(source).close()  # an empty book still gets an (empty) index
+    return total
+
+
+def _chapters_from_where(where):
+    """Chapter names a Chroma `where` clause restricts to, or None for no restriction."""
+    if not where:
+        return None
+    if "$and" in where:
+        for part in where["$and"]:
+            chapters = _chapters_from_where(part)
+            if chapters is not None:
+                return chapters
+        return None
+    cond = where.get("chapter")
+    if cond is None:
+        return None
+    if not isinstance(cond, dict):
+        return [cond]
+    if "$eq" in cond:
+        return [cond["$eq"]]
+    return list(cond.get("$in", [])) or None
+
+
+def search(source, query, k=20, where=None):
+    """
+    Returns [(chunk_id, bm25 score)] for the k best BM25 matches of the query, best first.
+    `where` may restrict the chapter ({"chapter": ...} with $eq or $in, possibly in $and).
+    """
+    terms = sorted(set(tokenize(query)))
+    if not terms or not exists(source):
+        return []
+    match = " OR ".join(f'"{t}"' for t in terms)
+    sql = ("SELECT c.chunk_id, bm25(terms) FROM terms JOIN chunks c ON c.id = terms.rowid "
+           "WHERE terms MATCH ?")
+    params = [match]
+    chapters = _chapters_from_where(where)
+    if chapters is not None:
+        sql += f" AND c.chapter IN ({','.join('?' * len(chapters))})"
+        params += chapters
+    sql += " ORDER BY bm25(terms) LIMIT ?"
+    params.append(k)
+    with get_connection(source) as conn:
+        # SQLite's bm25() is lower-is-better; flip it so higher means a better match
+        return [(chunk_id, -score) for chunk_id, score in conn.execute(sql, params).fetchall()]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuses several best-first lists of IDs into one: score(id) = Σ 1 / (k + rank)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query a book's BM25 index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_p = sub.add_parser("rebuild", help="Re-create the book's index from its Chroma collection")
+    rebuild_p.add_argument("--source", required=True, help="Book filename, e.g. Anatomie.pdf")
+    search_p = sub.add_parser("search", help="Show the best BM25 matches for a query")
+    search_p.add_argument("--source", required=True, help="Book filename, e.g. Anatomie.pdf")
+    search_p.add_argument("query")
+    search_p.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        print(f"Indexed {rebuild(args.source)} chunks of '{args.source}'.")
+    else:
+        print(f"Terms: {' '.join(tokenize(args.query))}")
+        for chunk_id, score in search(args.source, args.query, args.k):
+            print(f"{score:8.3f}  {chunk_id}")
+
+
+if __name__ == "__main__":
+    main()
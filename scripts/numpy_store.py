@@ -0,0 +1,390 @@
+"""
+In-process exact vector search over one book.
+
+A textbook holds a few thousand 384-dim vectors, so a brute-force scan of a
+memory-mapped float32 matrix answers a query in well under a millisecond, with no
+HNSW approximation and no metadata-filter overhead. NumpyVectorStore exports a book's
+Chroma collection to cache/vectors/<collection>/ (vectors.npy plus records.json with
+IDs, texts and metadata) and answers top-k with `where` filters evaluated as boolean
+masks over metadata columns.
+
+It is a LangChain VectorStore with Chroma's `get`, so it plugs in behind the `db`
+object the app's load_db returns (RETRIEVAL_BACKEND=numpy). The export is refreshed
+when the book's ingestion manifest changes.
+
+For large libraries QuantizedVectorStore (RETRIEVAL_BACKEND=int8 or pq) keeps only
+int8 or product-quantized codes in memory and re-ranks the best candidates with their
+float vectors.
+
+Chroma stays the store of record for every backend: ingestion writes there and the
+export is derived from it. The export and codes therefore add to the disk footprint;
+what these backends save is what the app holds in RAM at query time.
+
+Usage:
+    python scripts/numpy_store.py export --source "Anatomie.pdf"
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+import book_collections
+import ingest_state
+import lexical_index
+
+EXPORT_DIR = os.path.join("cache", "vectors")
+# "chroma", "numpy" (exact float32 search) or "int8"/"pq" (QuantizedVectorStore)
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "chroma")
+# Quantized search keeps this many candidates per requested result for the float re-rank
+RERANK_FACTOR = int(os.environ.get("RERANK_FACTOR", 10))
+RERANK_MIN_CANDIDATES = 50
+PQ_SUBSPACES = 48      # 384 dims → 48 sub-vectors of 8 dims, one byte each
+PQ_CENTROIDS = 256
+PQ_TRAIN_ITERATIONS = 15
+SCAN_BLOCK_ROWS = 4096  # codes are decoded this many rows at a time, so a scan never holds a float copy of them
+
+
+def _export_dir(source):
+    return os.path.join(EXPORT_DIR, book_collections.collection_name(source))
+
+
+def remove_export(source):
+    """Deletes a book's exported vectors."""
+    shutil.rmtree(_export_dir(source), ignore_errors=True)
+
+
+def export_book(source, batch_size=5000):
+    """
+    Writes a book's vectors, IDs, texts and metadata from its Chroma collection to
+    cache/vectors/. Returns the number of records exported.
+    """
+    mtime = ingest_state.state_mtime(source)  # taken first: a write during the export makes it stale
+    collection = book_collections.get_collection(source, create=False)
+    ids, documents, metadatas, vectors, offset = [], [], [], [], 0
+    while True:
+        records = collection.get(include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset)
+        if not records["ids"]:
+            break
+        offset += len(records["ids"])
+        ids += records["ids"]
+        documents += records["documents"]
+        metadatas += records["metadatas"]
+        vectors.append(np.asarray(records["embeddings"], dtype=np.float32))
+
+    folder = _export_dir(source)
+    os.makedirs(folder, exist_ok=True)
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    np.save(os.path.join(folder, "vectors.tmp.npy"), matrix)
+    with open(os.path.join(folder, "records.tmp.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": source, "manifest_mtime": mtime, "ids": ids, "documents": documents,
+                   "metadatas": metadatas}, f, ensure_ascii=False)
+    os.replace(os.path.join(folder, "vectors.tmp.npy"), os.path.join(folder, "vectors.npy"))
+    os.replace(os.path.join(folder, "records.tmp.json"), os.path.join(folder, "records.json"))
+    return len(ids)
+
+
+def _as_column(values):
+    """Packs one metadata field into an array: ints stay ints, anything else is dictionary-coded."""
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values if v is not None) \
+            and None not in values:
+        return np.asarray(values), None
+    vocab = {}
+    codes = np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32, count=len(values))
+    return codes, vocab
+
+
+def quantize_int8(vectors):
+    """Symmetric per-dimension int8 scalar quantization. Returns (codes, scales) with vectors ≈ codes * scales."""
+    scales = np.abs(vectors).max(axis=0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _kmeans(x, k, iterations, rng):
+    """Plain Lloyd's k-means. Returns the (k, dim) centroids."""
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        distances = (x * x).sum(1)[:, None] - 2.0 * (x @ centroids.T) + (centroids * centroids).sum(1)[None, :]
+        assign = distances.argmin(1)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]  # empty clusters keep their old centroid
+    return centroids
+
+
+def train_pq(vectors, subspaces=PQ_SUBSPACES, centroids=PQ_CENTROIDS, iterations=PQ_TRAIN_ITERATIONS, seed=0):
+    """
+    Product quantization: splits each vector into `subspaces` sub-vectors and replaces
+    each by the nearest of `centroids` k-means centroids trained for that subspace.
+    Returns (codes (n, subspaces) uint8, codebooks (subspaces, centroids, sub_dim)).
+    """
+    n, dim = vectors.shape
+    while dim % subspaces:
+        subspaces -= 1
+    centroids = min(centroids, n)
+    rng = np.random.default_rng(seed)
+    parts = vectors.reshape(n, subspaces, dim // subspaces)
+    codebooks = np.stack([_kmeans(parts[:, j], centroids, iterations, rng) for j in range(subspaces)])
+    codes = np.empty((n, subspaces), dtype=np.uint8)
+    for j in range(subspaces):
+        sub, book = parts[:, j], codebooks[j]
+        codes[:, j] = ((sub * sub).sum(1)[:, None] - 2.0 * (sub @ book.T) + (book * book).sum(1)[None, :]).argmin(1)
+    return codes, codebooks.astype(np.float32)
+
+
+def _top_k(distances, k):
+    """Rows of the k smallest finite distances, nearest first."""
+    k = min(k, int(np.isfinite(distances).sum()))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    top = np.argpartition(distances, k - 1)[:k]
+    return top[np.argsort(distances[top])]
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact L2 search over one book's exported vectors, with vectorized `where` filters."""
+
+    def __init__(self, source, embedding_function):
+        self.source = source
+        self._embedding = embedding_function
+        self._lock = threading.Lock()
+        self._loaded_mtime = False  # never loaded
+        self._load()
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, source=None, **kwargs):
+        """
+        Embeds texts into a book's Chroma collection, re-exports the book and returns a
+        store over all of it. The book is `source`, or the `source` of the first
+        metadata; chunks without IDs get their deterministic chunk ID. Other keyword
+        arguments go to the constructor (e.g. mode= for QuantizedVectorStore).
+        """
+        from build_vector_db import chunk_id
+        texts = list(texts)
+        source = source or ((metadatas or [{}])[0] or {}).get("source")
+        if not source:
+            raise ValueError("from_texts needs a source= book name or a 'source' in the metadata")
+        metadatas = [{**(m or {}), "source": source} for m in (metadatas or [{}] * len(texts))]
+        ids = list(ids) if ids is not None else [chunk_id(m, t) for m, t in zip(metadatas, texts)]
+        if texts:
+            book_collections.get_collection(source).upsert(
+                ids=ids, embeddings=embedding.embed_documents(texts), documents=texts, metadatas=metadatas)
+            if lexical_index.exists(source):
+                lexical_index.add_chunks(source, ids, texts, metadatas)
+        export_book(source)
+        return cls(source, embedding, **kwargs)
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def _load(self):
+        """(Re-)loads the export, exporting the book first if it is missing or older than its manifest."""
+        mtime = ingest_state.state_mtime(self.source)
+        if mtime == self._loaded_mtime:
+            return
+        with self._lock:
+            if mtime == self._loaded_mtime:
+                return  # another thread reloaded it meanwhile
+            folder = _export_dir(self.source)
+            records = None
+            if os.path.exists(os.path.join(folder, "records.json")):
+                with open(os.path.join(folder, "records.json"), "r", encoding="utf-8") as f:
+                    records = json.load(f)
+            if records is None or records.get("manifest_mtime") != mtime:
+                export_book(self.source)
+                with open(os.path.join(folder, "records.json"), "r", encoding="utf-8") as f:
+                    records = json.load(f)
+
+            self._vectors = np.load(os.path.join(folder, "vectors.npy"), mmap_mode="r")
+            self._load_index(folder, records)
+            self._ids = records["ids"]
+            self._documents = records["documents"]
+            self._metadatas = records["metadatas"]
+            self._columns = {}
+            self._loaded_mtime = records.get("manifest_mtime")
+
+    def _load_index(self, folder, records):
+        """Prepares the search index over self._vectors; subclasses load compressed codes instead."""
+        self._sq_norms = np.einsum("ij,ij->i", self._vectors, self._vectors) if len(self._vectors) else np.zeros(0)
+
+    def _column(self, key):
+        if key not in self._columns:
+            self._columns[key] = _as_column([(m or {}).get(key) for m in self._metadatas])
+        return self._columns[key]
+
+    def _mask(self, where):
+        """Evaluates a Chroma `where` clause ($and/$or, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte) as a boolean mask."""
+        n = len(self._ids)
+        if not where:
+            return np.ones(n, dtype=bool)
+        mask = np.ones(n, dtype=bool)
+        for key, cond in where.items():
+            if key in ("$and", "$or"):
+                parts = [self._mask(c) for c in cond]
+                mask &= np.logical_and.reduce(parts) if key == "$and" else np.logical_or.reduce(parts)
+                continue
+            if not isinstance(cond, dict):
+                cond = {"$eq": cond}
+            column, vocab = self._column(key)
+            for op, value in cond.items():
+                if vocab is not None:
+                    if op not in ("$eq", "$ne", "$in", "$nin"):
+                        raise ValueError(f"{op} is not supported on text field '{key}'")
+                    value = [vocab.get(v, -1) for v in value] if op in ("$in", "$nin") else vocab.get(value, -1)
+                if op == "$eq":
+                    mask &= column == value
+                elif op == "$ne":
+                    mask &= column != value
+                elif op == "$in":
+                    mask &= np.isin(column, value)
+                elif op == "$nin":
+                    mask &= ~np.isin(column, value)
+                elif op == "$gt":
+                    mask &= column > value
+                elif op == "$gte":
+                    mask &= column >= value
+                elif op == "$lt":
+                    mask &= column < value
+                elif op == "$lte":
+                    mask &= column <= value
+                else:
+                    raise ValueError(f"Unsupported filter operator {op}")
+        return mask
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas"), **kwargs):
+        """Chroma-compatible `get`: records matching ids/where, in stored order."""
+        self._load()
+        rows = np.flatnonzero(self._mask(where))
+        if ids is not None:
+            wanted = set(ids)
+            rows = [r for r in rows if self._ids[r] in wanted]
+        rows = list(rows)[offset or 0:]
+        if limit is not None:
+            rows = rows[:limit]
+        result = {"ids": [self._ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[r] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadatas[r] for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(self._vectors[rows]) if rows else np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    def search_by_vector(self, embedding, k=4, filter=None):
+        """Returns [(row, squared L2 distance)] of the k nearest records that pass the filter."""
+        self._load()
+        if not len(self._ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = self._sq_norms - 2.0 * (self._vectors @ query) + float(query @ query)
+        if filter:
+            distances = np.where(self._mask(filter), distances, np.inf)
+        top = _top_k(distances, k)
+        return [(int(r), float(distances[r])) for r in top]
+
+    def _documents_for(self, hits):
+        return [(Document(page_content=self._documents[r], metadata=self._metadatas[r], id=self._ids[r]), d)
+                for r, d in hits]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self._documents_for(self.search_by_vector(embedding, k, filter))]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        return self._documents_for(self.search_by_vector(self._embedding.embed_query(query), k, filter))
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+
+class QuantizedVectorStore(NumpyVectorStore):
+    """
+    NumpyVectorStore that scans compressed codes instead of float32 vectors: int8
+    scalar quantization (4x smaller) or product quantization (PQ_SUBSPACES bytes per
+    vector, 32x smaller for 384 dims). The top RERANK_FACTOR × k candidates are
+    re-ranked with their exact float distance, read from the memory-mapped float
+    matrix, so only those rows are ever paged in. The codes are stored next to the
+    export, on top of Chroma's copy: smaller in memory, larger on disk.
+    """
+
+    def __init__(self, source, embedding_function, mode="int8"):
+        if mode not in ("int8", "pq"):
+            raise ValueError(f"Unknown quantization mode '{mode}' (use 'int8' or 'pq')")
+        self.mode = mode
+        super().__init__(source, embedding_function)
+
+    def _load_index(self, folder, records):
+        index_path = os.path.join(folder, f"{self.mode}.npz")
+        index = np.load(index_path) if os.path.exists(index_path) else None
+        if index is None or index["manifest_mtime"].item() != str(records.get("manifest_mtime")):
+            vectors = np.asarray(self._vectors, dtype=np.float32)
+            if self.mode == "int8":
+                codes, book = quantize_int8(vectors) if len(vectors) else (np.zeros((0, 0), np.int8), np.ones(0, np.float32))
+            else:
+                codes, book = train_pq(vectors) if len(vectors) else (np.zeros((0, 0), np.uint8), np.zeros((0, 0, 0), np.float32))
+            sq_norms = np.einsum("ij,ij->i", vectors, vectors) if len(vectors) else np.zeros(0, np.float32)
+            np.savez(os.path.join(folder, f"{self.mode}.tmp.npz"), codes=codes, codebook=book, sq_norms=sq_norms,
+                     manifest_mtime=np.array(str(records.get("manifest_mtime"))))
+            os.replace(os.path.join(folder, f"{self.mode}.tmp.npz"), index_path)
+            index = np.load(index_path)
+        self._codes = index["codes"]
+        self._codebook = index["codebook"]
+        self._sq_norms = index["sq_norms"]
+
+    def index_bytes(self):
+        """Bytes of the compressed index kept in memory (codes, codebook and norms)."""
+        return self._codes.nbytes + self._codebook.nbytes + self._sq_norms.nbytes
+
+    def _approximate_distances(self, query):
+        distances = np.empty(len(self._codes), dtype=np.float32)
+        if self.mode == "int8":
+            scaled, query_norm = query * self._codebook, float(query @ query)
+            for start in range(0, len(self._codes), SCAN_BLOCK_ROWS):
+                rows = slice(start, start + SCAN_BLOCK_ROWS)
+                distances[rows] = self._sq_norms[rows] - 2.0 * (self._codes[rows] @ scaled) + query_norm
+            return distances
+        subspaces, _, sub_dim = self._codebook.shape
+        q = query.reshape(subspaces, 1, sub_dim)
+        table = ((self._codebook - q) ** 2).sum(-1)  # (subspaces, centroids) distance lookup table
+        for start in range(0, len(self._codes), SCAN_BLOCK_ROWS):
+            rows = slice(start, start + SCAN_BLOCK_ROWS)
+            distances[rows] = table[np.arange(subspaces), self._codes[rows]].sum(1)
+        return distances
+
+    def search_by_vector(self, embedding, k=4, filter=None):
+        self._load()
+        if not len(self._ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        approx = self._approximate_distances(query)
+        if filter:
+            approx = np.where(self._mask(filter), approx, np.inf)
+        candidates = _top_k(approx, max(k * RERANK_FACTOR, RERANK_MIN_CANDIDATES))
+        if not len(candidates):
+            return []
+        # Exact re-rank: only the candidate rows of the float matrix are read
+        rows = np.sort(candidates)
+        exact = self._sq_norms[rows] - 2.0 * (np.asarray(self._vectors[rows]) @ query) + float(query @ query)
+        order = np.argsort(exact)[:k]
+        return [(int(rows[i]), float(exact[i])) for i in order]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a book's vectors for in-process exact search.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_p = sub.add_parser("export", help="Write the book's vectors and metadata to cache/vectors/")
+    export_p.add_argument("--source", required=True, help="Book filename, e.g. Anatomie.pdf")
+    args = parser.parse_args()
+    print(f"Exported {export_book(args.source)} chunks of '{args.source}' to {_export_dir(args.source)}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+Persistent per-page text cache for PDF ingestion.
+
+Entries are keyed by the PDF's content hash, the page index, the render settings and
+the Tesseract language, and keep the page's OCR confidence. Re-uploading a book, retrying a failed embed or re-chunking after a
+chapter edit replays the cached page text instead of running OCR again.
+
+Usage:
+    python scripts/ocr_cache.py list
+    python scripts/ocr_cache.py prune --source "Anatomie.pdf"
+    python scripts/ocr_cache.py prune --all
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import sqlite3
+
+CACHE_DB_PATH = os.path.join("cache", "ocr_cache.db")
+MAX_CACHE_MB = int(os.environ.get("OCR_CACHE_MAX_MB", 512))
+
+
+def get_connection():
+    os.makedirs(os.path.dirname(CACHE_DB_PATH), exist_ok=True)
+    return sqlite3.connect(CACHE_DB_PATH)
+
+
+def init_cache():
+    """Creates the cache tables if they don't exist yet."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                pdf_hash TEXT,
+                page_idx INTEGER,
+                zoom TEXT,
+                lang TEXT,
+                text TEXT,
+                method TEXT,
+                confidence REAL,
+                size INTEGER,
+                last_used TIMESTAMP,
+                PRIMARY KEY (pdf_hash, page_idx, zoom, lang)
+            )
+        """)
+        # One row per PDF so entries can be listed and pruned by book name
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS books (
+                pdf_hash TEXT PRIMARY KEY,
+                source TEXT,
+                total_pages INTEGER,
+                updated_at TIMESTAMP
+            )
+        """)
+        # Migration: add the OCR confidence column to caches created before it existed
+        try:
+            cursor.execute("ALTER TABLE pages ADD COLUMN confidence REAL")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        conn.commit()
+
+
+def hash_pdf(pdf_source, chunk_size=1024 * 1024):
+    """Returns the SHA-256 of a PDF given as a file path or raw bytes."""
+    h = hashlib.sha256()
+    if isinstance(pdf_source, (bytes, bytearray)):
+        h.update(pdf_source)
+    else:
+        with open(pdf_source, "rb") as f:
+            for block in iter(lambda: f.read(chunk_size), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def get_cached_methods(pdf_hash, zoom, lang):
+    """Returns {page_idx: method} for every cached page of a PDF, without loading the text."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT page_idx, method FROM pages WHERE pdf_hash = ? AND zoom = ? AND lang = ?",
+            (pdf_hash, str(zoom), lang)
+        )
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+def get_pages(pdf_hash, zoom, lang, first_idx=0, last_idx=None):
+    """
+    Returns {page_idx: (text, method, confidence)} for the cached pages of a PDF, optionally
+    limited to the page range [first_idx, last_idx], and marks them as used.
+    """
+    now = datetime.datetime.now().isoformat()
+    if last_idx is None:
+        last_idx = 2 ** 31
+    params = (pdf_hash, str(zoom), lang, first_idx, last_idx)
+    where = "pdf_hash = ? AND zoom = ? AND lang = ? AND page_idx BETWEEN ? AND ?"
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT page_idx, text, method, confidence FROM pages WHERE {where}", params)
+        pages = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+        if pages:
+            cursor.execute(f"UPDATE pages SET last_used = ? WHERE {where}", (now,) + params)
+            conn.commit()
+    return pages
+
+
+def put_pages(pdf_hash, zoom, lang, pages, source=None, total_pages=None):
+    """Stores a list of (page_idx, text, method, confidence) results, then enforces the size cap."""
+    if not pages:
+        return
+    now = datetime.datetime.now().isoformat()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            "INSERT OR REPLACE INTO pages (pdf_hash, page_idx, zoom, lang, text, method, confidence, size, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(pdf_hash, idx, str(zoom), lang, text, method, confidence, len(text.encode("utf-8")), now)
+             for idx, text, method, confidence in pages]
+        )
+        if source:
+            cursor.execute(
+                "INSERT OR REPLACE INTO books (pdf_hash, source, total_pages, updated_at) VALUES (?, ?, ?, ?)",
+                (pdf_hash, source, total_pages, now)
+            )
+        conn.commit()
+    enforce_size_cap()
+
+
+def copy_pages(old_hash, new_hash, zoom, lang, page_map, source=None, total_pages=None):
+    """
+    Files cached pages of one PDF under another PDF's hash, e.g. the unchanged pages of
+    a new edition. page_map is {old_page_idx: new_page_idx}; pages the new PDF already
+    has are kept. Returns the number of pages copied.
+    """
+    if not page_map:
+        return 0
+    now = datetime.datetime.now().isoformat()
+    copied = 0
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        for old_idx, new_idx in page_map.items():
+            cursor.execute(
+                "INSERT OR IGNORE INTO pages (pdf_hash, page_idx, zoom, lang, text, method, confidence, size, last_used) "
+                "SELECT ?, ?, zoom, lang, text, method, confidence, size, ? FROM pages "
+                "WHERE pdf_hash = ? AND page_idx = ? AND zoom = ? AND lang = ?",
+                (new_hash, new_idx, now, old_hash, old_idx, str(zoom), lang)
+            )
+            copied += cursor.rowcount
+        if copied and source:
+            cursor.execute(
+                "INSERT OR REPLACE INTO books (pdf_hash, source, total_pages, updated_at) VALUES (?, ?, ?, ?)",
+                (new_hash, source, total_pages, now)
+            )
+        conn.commit()
+    return copied
+
+
+def enforce_size_cap(max_mb=MAX_CACHE_MB):
+    """Evicts least-recently-used pages until the cache fits in max_mb. Returns the number evicted."""
+    max_bytes = max_mb * 1024 * 1024
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(SUM(size), 0) FROM pages")
+        excess = cursor.fetchone()[0] - max_bytes
+        if excess <= 0:
+            return 0
+
+        cursor.execute("SELECT rowid, size FROM pages ORDER BY last_used ASC")
+        evict = []
+        for rowid, size in cursor.fetchall():
+            if excess <= 0:
+                break
+            evict.append((rowid,))
+            excess -= size
+        cursor.executemany("DELETE FROM pages WHERE rowid = ?", evict)
+        cursor.execute("DELETE FROM books WHERE pdf_hash NOT IN (SELECT DISTINCT pdf_hash FROM pages)")
+        conn.commit()
+    return len(evict)
+
+
+def list_books():
+    """Returns one summary dict per cached PDF, most recently used first."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT p.pdf_hash, COALESCE(b.source, '?'), b.total_pages,
+                   COUNT(*), SUM(p.size), MAX(p.last_used)
+            FROM pages p LEFT JOIN books b ON b.pdf_hash = p.pdf_hash
+            GROUP BY p.pdf_hash
+            ORDER BY MAX(p.last_used) DESC
+        """)
+        return [
+            {"pdf_hash": row[0], "source": row[1], "total_pages": row[2],
+             "pages": row[3], "bytes": row[4], "last_used": row[5]}
+            for row in cursor.fetchall()
+        ]
+
+
+def prune(source=None, pdf_hash=None):
+    """Deletes cached pages for a book (by filename or hash), or everything if neither is given."""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if source:
+            cursor.execute("SELECT pdf_hash FROM books WHERE source = ?", (source,))
+            hashes = [row[0] for row in cursor.fetchall()]
+        elif pdf_hash:
+            hashes = [pdf_hash]
+        else:
+            cursor.execute("SELECT DISTINCT pdf_hash FROM pages")
+            hashes = [row[0] for row in cursor.fetchall()]
+
+        removed = 0
+        for h in hashes:
+            cursor.execute("DELETE FROM pages WHERE pdf_hash = ?", (h,))
+            removed += cursor.rowcount
+            cursor.execute("DELETE FROM books WHERE pdf_hash = ?", (h,))
+        conn.commit()
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the per-page OCR cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List cached books")
+    prune_p = sub.add_parser("prune", help="Delete cached pages")
+    group = prune_p.add_mutually_exclusive_group(required=True)
+    group.add_argument("--source", help="Book filename, e.g. Anatomie.pdf")
+    group.add_argument("--hash", help="PDF content hash (prefix allowed)")
+    group.add_argument("--all", action="store_true", help="Empty the whole cache")
+    group.add_argument("--max-mb", type=int, help="Evict least-recently-used pages down to this size")
+    args = parser.parse_args()
+
+    init_cache()
+    if args.command == "list":
+        books = list_books()
+        if not books:
+            print("OCR cache is empty.")
+            return
+        total = 0
+        for b in books:
+            total += b["bytes"]
+            of_total = f"/{b['total_pages']}" if b["total_pages"] else ""
+            print(f"{b['pdf_hash'][:12]}  {b['pages']:>5}{of_total} pages  "
+                  f"{b['bytes'] / 1024:>9.1f} KB  {b['last_used'][:19]}  {b['source']}")
+        print(f"\n{len(books)} book(s), {total / 1024 / 1024:.1f} MB (cap {MAX_CACHE_MB} MB)")
+    elif args.max_mb is not None:
+        print(f"Evicted {enforce_size_cap(args.max_mb)} page(s).")
+    else:
+        pdf_hash = None
+        if args.hash:
+            matches = [b["pdf_hash"] for b in list_books() if b["pdf_hash"].startswith(args.hash)]
+            if len(matches) != 1:
+                print(f"Hash prefix '{args.hash}' matches {len(matches)} books.")
+                return
+            pdf_hash = matches[0]
+        print(f"Removed {prune(source=args.source, pdf_hash=pdf_hash)} cached page(s).")
+
+
+if __name__ == "__main__":
+    main()
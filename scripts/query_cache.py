@@ -0,0 +1,108 @@
+"""
+Caches for repeated study questions.
+
+Students ask the same questions over and over. `LRUCache` keeps the retrieved chunks
+of recent questions in memory, keyed by book, chapter scope and normalized question,
+so a repeat is answered from memory without touching the vector store. Every entry
+is stored with the book's version (the modification time of its ingestion manifest,
+which changes whenever the book is ingested, re-indexed or re-tagged); an entry whose
+book has changed since is a miss. `embed_query` caches question embeddings in the
+same way, and also persists them in the embedding cache, so the vector of a repeated
+question survives app restarts.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import embedding_cache
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 256))  # entries per cache; 0 disables caching
+
+
+def normalize_query(text):
+    """Case-folds a question and collapses whitespace and trailing punctuation, so trivial variants share a key."""
+    return re.sub(r"\s+", " ", text.casefold()).strip().rstrip("?!. ")
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache whose keys are tuples starting with the book's filename.
+    Values are stored with a version; `get` with a different version is a miss and
+    drops the stale entry.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, version=None):
+        """Returns the cached value, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] != version:
+                del self._entries[key]
+                self.invalidations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, version=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, book=None):
+        """Drops every entry of a book, or everything. Returns the number of entries dropped."""
+        with self._lock:
+            keys = [k for k in self._entries if book is None or k[0] == book]
+            for k in keys:
+                del self._entries[k]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def stats(self):
+        """Returns {"hits", "misses", "invalidations", "entries", "hit_rate"}."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                    "entries": len(self._entries), "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+_QUERY_VECTORS = LRUCache()
+
+
+def embed_query(embeddings, model_name, text):
+    """
+    Returns the query embedding of a question, from memory or the persistent embedding
+    cache when it was asked before. Query vectors are kept apart from the document
+    vectors of the same model, since retrieval models embed queries differently.
+    """
+    key = (None, normalize_query(text))
+    vector = _QUERY_VECTORS.get(key)
+    if vector is None:
+        namespace = f"{model_name}#query"
+        text_hash = embedding_cache.text_hash(key[1])
+        vector = embedding_cache.lookup(namespace, [text_hash]).get(text_hash)
+        if vector is None:
+            vector = embeddings.embed_query(text)
+            embedding_cache.store(namespace, [text_hash], [vector])
+        vector = [float(x) for x in vector]
+        _QUERY_VECTORS.put(key, vector)
+    return vector
+
+
+def query_vector_stats():
+    return _QUERY_VECTORS.stats()
@@ -0,0 +1,59 @@
+import os
+import random
+import sys
+
+import fitz
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+import book_collections  # noqa: E402
+import build_vector_db  # noqa: E402
+from chromadb.api.shared_system_client import SharedSystemClient  # noqa: E402
+
+WORDS = ("spier bot gewricht pees zenuw bloedvat hart long lever nier huid oog oor "
+         "cel weefsel orgaan skelet schedel wervel rib bekken heup knie enkel voet").split()
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0]
+
+
+def body(seed):
+    rng = random.Random(seed)
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(10)) for _ in range(8))
+
+
+def write_pdf(path, bodies):
+    doc = fitz.open()
+    for number, text in enumerate(bodies, start=1):
+        page = doc.new_page()
+        page.insert_text((72, 60), "Anatomie en Fysiologie - Hoofdstuk 1")
+        page.insert_text((72, 100), text)
+        page.insert_text((72, 780), f"Pagina {number}")
+    doc.save(path)
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(book_collections, "_seen_version", None)
+    monkeypatch.setattr(build_vector_db, "load_embeddings", lambda *args, **kwargs: FakeEmbeddings())
+    SharedSystemClient.clear_system_cache()
+    yield tmp_path
+    SharedSystemClient.clear_system_cache()
+
+
+def build(path, source, **kwargs):
+    return build_vector_db.build_vector_db(str(path), source=source, workers=1, embed_cache=False, **kwargs)
+
+
+def chunks(source):
+    records = book_collections.get_collection(source, create=False).get(include=["documents", "metadatas"])
+    return sorted((meta["page"], meta["chapter"], text) for meta, text in zip(records["metadatas"], records["documents"]))
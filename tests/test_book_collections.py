@@ -0,0 +1,63 @@
+import subprocess
+import sys
+
+import pytest
+from chromadb.api.shared_system_client import SharedSystemClient
+
+import book_collections
+from conftest import SCRIPTS_DIR
+
+SOURCE = "Anatomie.pdf"
+
+# Stands in for the ingestion worker: upserts chunks and commits a checkpoint, then
+# stays alive until told to exit, like a worker in the middle of a book
+WRITER = f"""
+import sys
+sys.path.insert(0, {SCRIPTS_DIR!r})
+import book_collections, ingest_state
+ids = sys.argv[1:]
+book_collections.get_collection({SOURCE!r}).upsert(
+    ids=ids, embeddings=[[0.1 * k, 1.0] for k in range(len(ids))], documents=ids)
+ingest_state.save_state(ingest_state.new_state({SOURCE!r}, "hash", {{}}, 10))
+print("written", flush=True)
+sys.stdin.readline()
+"""
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(book_collections, "_seen_version", None)
+    SharedSystemClient.clear_system_cache()
+    yield
+    SharedSystemClient.clear_system_cache()
+
+
+def write_in_other_process(*ids):
+    writer = subprocess.Popen([sys.executable, "-c", WRITER, *ids], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True)
+    assert writer.stdout.readline().strip() == "written"
+    return writer
+
+
+def query_ids(collection):
+    return collection.query(query_embeddings=[[0.0, 1.0]], n_results=10)["ids"][0]
+
+
+def test_refresh_client_shows_writes_of_another_process(store):
+    first = write_in_other_process("a")
+    first.communicate("\n")
+    collection = book_collections.get_collection(SOURCE, create=False)
+    assert not book_collections.refresh_client()
+    assert query_ids(collection) == ["a"]
+
+    writer = write_in_other_process("b", "c")
+    try:
+        # Without a refresh this process keeps serving its old index
+        assert query_ids(collection) == ["a"]
+        assert book_collections.refresh_client()
+        fresh = book_collections.get_collection(SOURCE, create=False)
+        assert sorted(query_ids(fresh)) == ["a", "b", "c"]
+        assert not book_collections.refresh_client()
+    finally:
+        writer.communicate("\n")
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+
+import fitz
+
+import book_collections
+import build_vector_db
+import lexical_index
+import ocr_cache
+from conftest import body, build, chunks, write_pdf
+
+
+def test_full_rebuild_drops_chunks_it_no_longer_produces(library):
+    bodies = [body(k) for k in range(12)]
+    write_pdf(library / "v1.pdf", bodies)
+    bodies[4] = body(100)
+    write_pdf(library / "v2.pdf", bodies)
+
+    build(library / "v1.pdf", "Anatomie.pdf")
+    build(library / "v2.pdf", "Anatomie.pdf", incremental=False)
+    rebuilt = chunks("Anatomie.pdf")
+    build(library / "v2.pdf", "Fresh.pdf")
+
+    assert rebuilt == chunks("Fresh.pdf")
+    ids = book_collections.get_collection("Anatomie.pdf", create=False).get(include=[])["ids"]
+    with lexical_index.get_connection("Anatomie.pdf") as conn:
+        indexed = [row[0] for row in conn.execute("SELECT chunk_id FROM chunks")]
+    assert sorted(indexed) == sorted(ids)
+
+
+def test_update_chapter_map_retags_in_place(library):
+    write_pdf(library / "v1.pdf", [body(k) for k in range(4)])
+    build(library / "v1.pdf", "Anatomie.pdf")
+
+    assert build_vector_db.update_chapter_map("Anatomie.pdf", {1: "Inleiding", 3: "Hoofdstuk 1"}) > 0
+    assert {(page, chapter) for page, chapter, _ in chunks("Anatomie.pdf")} == {
+        (1, "Inleiding"), (2, "Inleiding"), (3, "Hoofdstuk 1"), (4, "Hoofdstuk 1")}
+
+
+def test_pages_evicted_during_a_run_are_extracted_again(library, monkeypatch):
+    write_pdf(library / "v1.pdf", [body(k) for k in range(12)])
+    expected = build_vector_db.process_pdf(str(library / "v1.pdf"), source="Anatomie.pdf", workers=1)
+
+    listed = ocr_cache.get_cached_methods
+
+    def list_then_evict(*args):
+        # Another ingest pushes the cache over its cap right after this run listed its pages
+        methods = listed(*args)
+        with ocr_cache.get_connection() as conn:
+            conn.execute("DELETE FROM pages WHERE page_idx >= 5")
+        return methods
+
+    monkeypatch.setattr(ocr_cache, "get_cached_methods", list_then_evict)
+    replayed = build_vector_db.process_pdf(str(library / "v1.pdf"), source="Anatomie.pdf", workers=1)
+    assert [(d.page_content, d.metadata) for d in replayed] == [(d.page_content, d.metadata) for d in expected]
+
+
+def test_blocks_read_with_zero_confidence_are_retried(monkeypatch):
+    @contextmanager
+    def render(page, zoom, clip=None):
+        yield None, zoom
+
+    def ocr_data(zoom, lang, config=""):
+        # The fast pass reads garbage with confidence 0, the retry reads it properly
+        retry = bool(config)
+        return {"text": ["Spieren" if retry else "$p!3r3n"], "conf": [95 if retry else 0], "block_num": [1],
+                "par_num": [1], "line_num": [1], "left": [10], "top": [10], "width": [50], "height": [10]}
+
+    monkeypatch.setattr(build_vector_db, "_render_gray", render)
+    monkeypatch.setattr(build_vector_db, "_is_blank", lambda pix: False)
+    monkeypatch.setattr(build_vector_db, "_ocr_data", ocr_data)
+    monkeypatch.setattr(build_vector_db, "SELECTIVE_OCR", True)
+    page = fitz.open().new_page()
+
+    assert build_vector_db._ocr_page(page, zoom=2.0) == ("Spieren", 95.0)
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pytest
+
+import embedding_cache
+
+MODEL = "test/model"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return embedding_cache._vectors_path(MODEL)
+
+
+def vectors(*values):
+    return np.array([[v, v + 1.0, v + 2.0] for v in values], dtype=np.float32)
+
+
+def test_lookup_ignores_a_partial_tail(cache):
+    embedding_cache.store(MODEL, ["a", "b"], vectors(1, 2))
+    # Another process halfway through appending a row it hasn't committed yet
+    with open(cache, "ab") as f:
+        f.write(vectors(9).tobytes()[:5])
+
+    found = embedding_cache.lookup(MODEL, ["a", "b", "c"])
+    assert sorted(found) == ["a", "b"]
+    np.testing.assert_array_equal(found["b"], vectors(2)[0])
+
+
+def test_store_truncates_what_a_crashed_run_left(cache):
+    embedding_cache.store(MODEL, ["a"], vectors(1))
+    with open(cache, "ab") as f:
+        f.write(vectors(7, 8).tobytes()[:17])
+
+    embedding_cache.store(MODEL, ["b"], vectors(2))
+    assert os.path.getsize(cache) == 2 * 3 * 4
+    found = embedding_cache.lookup(MODEL, ["a", "b"])
+    np.testing.assert_array_equal(found["a"], vectors(1)[0])
+    np.testing.assert_array_equal(found["b"], vectors(2)[0])
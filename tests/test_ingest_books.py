@@ -0,0 +1,14 @@
+import pytest
+
+from ingest_books import split_budget
+
+
+@pytest.mark.parametrize("cpus, parallel", [(8, 2), (16, 3), (12, 1), (5, 2)])
+def test_split_budget_stays_within_the_cpus(cpus, parallel):
+    workers, embed_threads = split_budget(cpus, parallel)
+    assert workers >= 1 and embed_threads >= 1
+    assert (workers + embed_threads) * parallel <= cpus
+
+
+def test_split_budget_gives_one_of_each_on_a_single_cpu_share():
+    assert split_budget(2, 2) == (1, 1)
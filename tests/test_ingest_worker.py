@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+
+import ingest_worker
+from conftest import SCRIPTS_DIR
+
+RUN_WORKER = f"""
+import sys
+sys.path.insert(0, {SCRIPTS_DIR!r})
+import ingest_worker
+ingest_worker.run_worker(exit_when_idle=0)
+"""
+
+
+def run_worker_process():
+    return subprocess.run([sys.executable, "-c", RUN_WORKER], capture_output=True, text=True, timeout=120).stdout
+
+
+def test_only_the_lock_holder_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    lock = ingest_worker._acquire_worker_lock()
+    assert lock is not None
+    try:
+        with open(ingest_worker.PID_FILE, "w") as f:
+            f.write(str(os.getpid()))
+        assert ingest_worker._acquire_worker_lock() is None
+        assert "already running" in run_worker_process()
+        assert ingest_worker.worker_pid() == os.getpid()  # the loser left the PID file alone
+    finally:
+        os.close(lock)
+
+    output = run_worker_process()
+    assert "started" in output and "No jobs left" in output
+    assert ingest_worker.worker_pid() is None
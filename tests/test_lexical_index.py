@@ -0,0 +1,10 @@
+import lexical_index
+
+
+def test_tokenize_stems_dutch_and_drops_stopwords():
+    assert lexical_index.tokenize("De lichamelijke gezondheid van de Spieren en ogen") == [
+        "licham", "gezond", "spier", "ogen"]
+
+
+def test_tokenize_keeps_numbers_and_folds_accents():
+    assert lexical_index.tokenize("Geërfd in 1984, café") == ["geerfd", "1984", "caf"]
@@ -0,0 +1,56 @@
+import numpy as np
+
+import book_collections
+import build_vector_db
+import ingest_state
+import numpy_store
+from conftest import FakeEmbeddings
+from numpy_store import NumpyVectorStore, QuantizedVectorStore
+
+
+def test_from_texts_stores_and_searches_the_book(library):
+    texts = ["spier", "gewricht en pees", "bloedvat van het hart"]
+    metadatas = [{"page": k + 1, "chapter": "Hoofdstuk 1"} for k in range(3)]
+    store = NumpyVectorStore.from_texts(texts, FakeEmbeddings(), metadatas=metadatas, source="Anatomie.pdf")
+
+    assert book_collections.get_collection("Anatomie.pdf", create=False).count() == 3
+    assert sorted(store.get()["documents"]) == sorted(texts)
+    hit = store.similarity_search("gewricht en peez", k=1)[0]
+    assert hit.page_content == "gewricht en pees"
+    assert hit.metadata == {"page": 2, "chapter": "Hoofdstuk 1", "source": "Anatomie.pdf"}
+
+
+def test_from_texts_passes_the_mode_to_quantized_stores(library):
+    store = QuantizedVectorStore.from_texts(["a" * 5, "b" * 50], FakeEmbeddings(),
+                                            metadatas=[{"source": "Anatomie.pdf"}] * 2, mode="int8")
+    assert store.mode == "int8"
+    assert store.similarity_search("c" * 48, k=1)[0].page_content == "b" * 50
+
+
+def test_retagging_a_book_without_manifest_refreshes_the_export(library):
+    NumpyVectorStore.from_texts(["spier", "gewricht"], FakeEmbeddings(),
+                                metadatas=[{"page": 1, "chapter": "Oud"}, {"page": 2, "chapter": "Oud"}],
+                                source="Anatomie.pdf")
+    assert ingest_state.load_state("Anatomie.pdf") is None  # like a book moved over by migrate
+
+    build_vector_db.update_chapter_map("Anatomie.pdf", {1: "Inleiding", 2: "Hoofdstuk 1"})
+    store = NumpyVectorStore("Anatomie.pdf", FakeEmbeddings())
+    assert sorted(m["chapter"] for m in store.get()["metadatas"]) == ["Hoofdstuk 1", "Inleiding"]
+
+
+def test_quantized_scan_in_blocks_matches_a_single_pass(library, monkeypatch):
+    rng = np.random.default_rng(0)
+    texts = [f"tekst {k}" for k in range(300)]
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+
+    class Embeddings:
+        def embed_documents(self, docs):
+            return [vectors[texts.index(d)].tolist() for d in docs]
+
+    query = rng.standard_normal(16).astype(np.float32)
+    for mode in ("int8", "pq"):
+        store = QuantizedVectorStore.from_texts(texts, Embeddings(), source="Anatomie.pdf", mode=mode)
+        monkeypatch.setattr(numpy_store, "SCAN_BLOCK_ROWS", 10 ** 9)
+        single = store._approximate_distances(query)
+        monkeypatch.setattr(numpy_store, "SCAN_BLOCK_ROWS", 7)
+        np.testing.assert_allclose(store._approximate_distances(query), single, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,33 @@
+from conftest import body, build, chunks, write_pdf
+
+
+def test_reindex_strips_boilerplate_like_a_full_build(library):
+    bodies = [body(k) for k in range(30)]
+    write_pdf(library / "v1.pdf", bodies)
+    # The new edition rewrites one page and turns another into a copy of a kept page
+    bodies[11] = bodies[2]
+    bodies[24] = body(100)
+    write_pdf(library / "v2.pdf", bodies)
+
+    build(library / "v1.pdf", "Anatomie.pdf")
+    result = build(library / "v2.pdf", "Anatomie.pdf")
+    assert result["changed"] == 2
+    build(library / "v2.pdf", "Rebuilt.pdf")
+
+    reindexed, rebuilt = chunks("Anatomie.pdf"), chunks("Rebuilt.pdf")
+    assert reindexed == rebuilt
+    assert not any("Pagina" in text or "Hoofdstuk" in text for _, _, text in reindexed)
+    assert 12 not in {page for page, _, _ in reindexed}
+
+
+def test_inserted_pages_renumber_the_pages_after_them(library):
+    bodies = [body(k) for k in range(30)]
+    write_pdf(library / "v1.pdf", bodies)
+    # Every later page moves by two and prints a different "Pagina N" footer
+    write_pdf(library / "v2.pdf", bodies[:10] + [body(100), body(101)] + bodies[10:])
+
+    build(library / "v1.pdf", "Anatomie.pdf")
+    result = build(library / "v2.pdf", "Anatomie.pdf")
+    assert (result["added"], result["changed"], result["kept"], result["removed"]) == (2, 0, 30, 0)
+    build(library / "v2.pdf", "Rebuilt.pdf")
+    assert chunks("Anatomie.pdf") == chunks("Rebuilt.pdf")